@@ -1,11 +1,26 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_from_directory, g, Response
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+import base64
+import csv
+import io
+import json
+import time
 import mercadopago
 import os
-from database import criar_banco # Importa a função do outro arquivo
+from database import criar_banco, fontes_vendas, PoolDeConexoes, SnapshotDeLeitura, DB_SNAPSHOT_IDADE_MAX # Importa do outro arquivo
+from webhook_worker import ProcessadorWebhook, enfileirar_notificacao
+from catalogo import cache_catalogo
+from previsao import cache_previsao
+from respostas import comprimir, resposta_json
+from gravador import GRUPO_COMMIT, GravadorEmGrupo
+from mudancas import TABELAS_MUDANCAS, ResincronizacaoNecessaria, cursor_atual, ler_mudancas
+import metricas
+import autenticacao
+from autenticacao import ServidorOcupado
+from importacao import CAMPOS_ESTOQUE, CAMPOS_PRODUTO, ImportacaoInvalida, ler_linhas, validar_linhas
+from metricas import ConexaoInstrumentada
 
-app = Flask(_name_, static_folder='.', static_url_path='')
+app = Flask(__name__, static_folder='.', static_url_path='')
 
 # --- ALTERAÇÕES PARA RENDER ---
 # 1. Define o caminho do banco de dados usando o Disco Persistente do Render
@@ -18,11 +33,164 @@ MERCADO_PAGO_TOKEN = os.environ.get("MERCADO_PAGO_TOKEN")
 # 3. Garante que o banco de dados seja criado na primeira vez que o servidor iniciar
 criar_banco()
 
+# 4. Pool de conexões por processo (tamanho e PRAGMAs vêm das variáveis DB_*).
+#    Com METRICAS_ATIVAS, cada comando SQL é cronometrado (ver /metrics)
+fabrica_conexoes = ConexaoInstrumentada if metricas.METRICAS_ATIVAS else sqlite3.Connection
+pool_conexoes = PoolDeConexoes(DB_FILE, factory=fabrica_conexoes)
+
+# 4.1 Relatórios e listagens usam conexões separadas, somente leitura (mode=ro e
+#     query_only), para não disputar o pool do caminho de escrita (vendas, webhook).
+#     Com DB_SNAPSHOT_IDADE_MAX > 0, as análises mais pesadas leem de uma cópia do
+#     banco com no máximo essa idade, em segundos.
+pool_leitura = PoolDeConexoes(DB_FILE, factory=fabrica_conexoes, somente_leitura=True)
+fonte_analises = (
+    SnapshotDeLeitura(DB_FILE, DB_SNAPSHOT_IDADE_MAX, pool_leitura, fabrica_conexoes)
+    if DB_SNAPSHOT_IDADE_MAX > 0 else pool_leitura
+)
+
+# 4.2 Com GRUPO_COMMIT=1, vendas e itens do webhook são gravados em micro-lotes
+#     por uma thread gravadora (um commit por lote, ver gravador.py)
+gravador = GravadorEmGrupo(DB_FILE, factory=fabrica_conexoes) if GRUPO_COMMIT else None
+
+# 5. Processa as notificações do Mercado Pago em segundo plano, com um único cliente do SDK
+processador_webhook = ProcessadorWebhook(
+    mercadopago.SDK(MERCADO_PAGO_TOKEN or "SEU_ACCESS_TOKEN").payment(), DB_FILE, gravador=gravador
+)
+processador_webhook.iniciar()
+
 def get_db_connection():
-    """Cria uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Retorna a conexão do pool associada ao contexto da requisição atual."""
+    if 'db' not in g:
+        g.db = pool_conexoes.obter()
+    return g.db
+
+def get_db_leitura():
+    """Conexão somente leitura da requisição atual (listagens e relatórios)."""
+    if 'db_leitura' not in g:
+        g.db_leitura = pool_leitura.obter()
+    return g.db_leitura
+
+def get_db_analises():
+    """Conexão para as análises pesadas: o snapshot, se ativo, ou a de leitura."""
+    if 'db_analises' not in g:
+        g.db_analises = fonte_analises.obter()
+    return g.db_analises
+
+@app.teardown_appcontext
+def devolver_conexao(exc):
+    """Devolve as conexões aos seus pools ao final da requisição."""
+    for chave, origem in (('db', pool_conexoes), ('db_leitura', pool_leitura), ('db_analises', fonte_analises)):
+        conn = g.pop(chave, None)
+        if conn is not None:
+            origem.devolver(conn)
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+@app.before_request
+def carregar_sessao():
+    """Lê o token de sessão, se houver. Verificar a assinatura é barato (um HMAC)."""
+    cabecalho = request.headers.get('Authorization', '')
+    g.usuario = autenticacao.ler_token(cabecalho[7:]) if cabecalho.startswith('Bearer ') else None
+
+@app.after_request
+def registrar_latencia(resposta):
+    """Registra a latência da rota (para respostas em streaming, até o início do envio)."""
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None and metricas.METRICAS_ATIVAS:
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        metricas.observar_requisicao(rota, request.method, resposta.status_code, time.perf_counter() - inicio)
+    return resposta
+
+@app.after_request
+def comprimir_resposta(resposta):
+    """gzip/brotli nas respostas grandes (roda antes de registrar_latencia, que entra na conta)."""
+    return comprimir(resposta)
+
+@app.route('/metrics')
+def exportar_metricas():
+    """Métricas de latência deste processo no formato texto do Prometheus."""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+def _resposta_catalogo(corpo, etag):
+    """Resposta JSON pré-serializada com ETag; devolve 304 se o cliente já tem a versão."""
+    resposta = Response(corpo, mimetype='application/json')
+    resposta.set_etag(etag)
+    return resposta.make_conditional(request)
+
+def _ler_limite(padrao=100, maximo=1000):
+    """Lê o parâmetro ?limite= da requisição, restrito ao intervalo [1, maximo]."""
+    limite = request.args.get('limite', padrao, type=int)
+    return max(1, min(limite, maximo))
+
+# --- Listagens paginadas ---
+# ?limite=N&cursor=<opaco> (paginação por chave), ?nome=<prefixo>, ?campos=a,b
+# e ?contar=1. Sem nenhum desses parâmetros as rotas devolvem a lista completa,
+# no formato antigo, para não quebrar os clientes existentes.
+PARAMETROS_LISTAGEM = ('limite', 'cursor', 'nome', 'campos', 'contar')
+
+def _listagem_paginada():
+    return any(p in request.args for p in PARAMETROS_LISTAGEM)
+
+def _filtro_prefixo(coluna):
+    """Filtro ?nome= por prefixo, sem diferenciar maiúsculas (usa os índices NOCASE)."""
+    prefixo = request.args.get('nome')
+    if not prefixo:
+        return [], []
+    prefixo = prefixo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return [f"{coluna} LIKE ? ESCAPE '\\'"], [prefixo + '%']
+
+def _listar(origem, colunas, ordem, filtros=(), params=()):
+    """Uma página da consulta, ordenada pela chave `ordem` (a última expressão deve ser única).
+
+    `colunas` mapeia cada campo da resposta para a sua expressão SQL. O cursor
+    devolvido é a chave da última linha, codificada. Para o índice entregar as
+    linhas já ordenadas, `ordem` deve usar a mesma collation do índice (ex.:
+    'nome COLLATE NOCASE' com os índices NOCASE do filtro ?nome=).
+    """
+    campos = request.args.get('campos')
+    campos = campos.split(',') if campos else list(colunas)
+    invalidos = [c for c in campos if c not in colunas]
+    if invalidos:
+        raise ParametroInvalido(f"Campos inválidos: {', '.join(invalidos)}")
+    limite = _ler_limite()
+    filtros, params = list(filtros), list(params)
+
+    conn = get_db_leitura()
+    resposta = {}
+    if request.args.get('contar') == '1':
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+        resposta['total'] = conn.execute(f'SELECT COUNT(*) FROM {origem} {where}', params).fetchone()[0]
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            chave = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            chave = None
+        if not isinstance(chave, list) or len(chave) != len(ordem):
+            raise ParametroInvalido('Cursor inválido.')
+        # O limite só na primeira coluna vira uma busca por faixa no índice; a
+        # comparação de row values sozinha faria o SQLite varrer desde o início
+        filtros.append(f"{ordem[0]} >= ? AND ({', '.join(ordem)}) > ({', '.join('?' * len(ordem))})")
+        params += [chave[0], *chave]
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+
+    selecao = [f'{colunas[c]} as "{c}"' for c in campos] + [f'{e} as _chave{i}' for i, e in enumerate(ordem)]
+    # Busca um item a mais só para saber se existe uma próxima página
+    linhas = conn.execute(
+        f"SELECT {', '.join(selecao)} FROM {origem} {where} ORDER BY {', '.join(ordem)} LIMIT ?",
+        (*params, limite + 1)
+    ).fetchall()
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    resposta['itens'] = [{c: linha[c] for c in campos} for linha in linhas]
+    resposta['proximo_cursor'] = None
+    if tem_mais:
+        chave = [linhas[-1][f'_chave{i}'] for i in range(len(ordem))]
+        resposta['proximo_cursor'] = base64.urlsafe_b64encode(json.dumps(chave).encode()).decode().rstrip('=')
+    return resposta_json(resposta)
 
 # --- Rota Principal para servir o HTML ---
 @app.route('/')
@@ -44,40 +212,70 @@ def register():
     count = conn.execute('SELECT COUNT(id) FROM usuarios').fetchone()[0]
     role = 'admin' if count == 0 else 'user'
     
+    senha_hash = autenticacao.gerar_hash(senha)
     try:
         conn.execute(
             'INSERT INTO usuarios (email, senha, role) VALUES (?, ?, ?)',
-            (email, generate_password_hash(senha), role)
+            (email, senha_hash, role)
         )
         conn.commit()
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Este email já está cadastrado.'}), 409
-    finally:
-        conn.close()
         
     return jsonify({'message': 'Usuário registrado com sucesso!', 'role': role})
 
 @app.route('/api/login', methods=['POST'])
 def login():
-    """Realiza o login de um usuário."""
+    """Realiza o login de um usuário e devolve um token de sessão assinado."""
     data = request.get_json()
     email = data['email']
     senha = data['password']
     
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM usuarios WHERE email = ?', (email,)).fetchone()
-    conn.close()
     
-    if user and check_password_hash(user['senha'], senha):
-        return jsonify({'message': 'Login bem-sucedido!', 'user': {'email': user['email'], 'role': user['role']}})
+    if user and autenticacao.verificar_senha(user['senha'], senha):
+        # Hashes com parâmetros antigos são atualizados no primeiro login bem-sucedido
+        if autenticacao.precisa_rehash(user['senha']):
+            conn.execute('UPDATE usuarios SET senha = ? WHERE id = ?', (autenticacao.gerar_hash(senha), user['id']))
+            conn.commit()
+        return jsonify({
+            'message': 'Login bem-sucedido!',
+            'user': {'email': user['email'], 'role': user['role']},
+            'token': autenticacao.emitir_token(user)
+        })
     
     return jsonify({'error': 'Email ou senha inválidos.'}), 401
 
+@app.route('/api/sessao', methods=['GET'])
+def get_sessao():
+    """Valida o token (Authorization: Bearer <token>) e devolve o usuário da sessão."""
+    if not g.usuario:
+        return jsonify({'error': 'Sessão inválida ou expirada.'}), 401
+    return jsonify({'user': {'email': g.usuario['email'], 'role': g.usuario['role']}})
+
+@app.errorhandler(ServidorOcupado)
+def servidor_ocupado(e):
+    return jsonify({'error': 'Servidor ocupado, tente novamente.'}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(ImportacaoInvalida)
+def importacao_invalida(e):
+    return jsonify({'error': str(e)}), 400
+
+class ParametroInvalido(Exception):
+    """Parâmetro de listagem inválido (campos, cursor)."""
+
+@app.errorhandler(ParametroInvalido)
+def parametro_invalido(e):
+    return jsonify({'error': str(e)}), 400
+
 
 # --- API para Produtos ---
+COLUNAS_PRODUTOS = {c: c for c in ('id', 'nome', 'preco_custo', 'preco_venda')}
+
 @app.route('/api/produtos', methods=['GET', 'POST'])
 def handle_produtos():
-    """Lida com a listagem e criação de produtos."""
+    """Lida com a listagem e criação de produtos (GET aceita os parâmetros de listagem paginada)."""
     conn = get_db_connection()
     if request.method == 'POST':
         data = request.get_json()
@@ -86,13 +284,16 @@ def handle_produtos():
             (data['nome'], data['precoCusto'], data['precoVenda'])
         )
         conn.commit()
-        conn.close()
+        cache_catalogo.invalidar()
         return jsonify({'message': 'Produto criado com sucesso!'}), 201
     
-    # GET
-    produtos = conn.execute('SELECT * FROM produtos ORDER BY nome').fetchall()
-    conn.close()
-    return jsonify([dict(p) for p in produtos])
+    if _listagem_paginada():
+        filtros, params = _filtro_prefixo('nome')
+        return _listar('produtos', COLUNAS_PRODUTOS, ('nome COLLATE NOCASE', 'id'), filtros, params)
+
+    # GET (servido do cache do catálogo)
+    catalogo = cache_catalogo.obter(conn)
+    return _resposta_catalogo(catalogo.produtos_json, catalogo.etag_produtos)
 
 @app.route('/api/produtos/<int:id>', methods=['DELETE'])
 def delete_produto(id):
@@ -100,13 +301,47 @@ def delete_produto(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM produtos WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
+    cache_catalogo.invalidar()
     return jsonify({'message': 'Produto apagado com sucesso!'})
 
+@app.route('/api/produtos/importar', methods=['POST'])
+def importar_produtos():
+    """Importa produtos em massa (CSV ou lista JSON) em uma única transação.
+
+    Linhas com `id` atualizam o produto com esse id (ou o criam); linhas sem
+    `id` criam produtos novos. Se alguma linha for inválida, nada é gravado.
+    """
+    registros, erros = validar_linhas(ler_linhas(request), CAMPOS_PRODUTO)
+    if erros:
+        return jsonify({'error': 'Importação rejeitada.', 'erros': erros}), 400
+
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany(
+        '''
+        INSERT INTO produtos (id, nome, preco_custo, preco_venda) VALUES (:id, :nome, :preco_custo, :preco_venda)
+        ON CONFLICT (id) DO UPDATE SET
+            nome = excluded.nome, preco_custo = excluded.preco_custo, preco_venda = excluded.preco_venda
+        ''',
+        [registro for _, registro in registros]
+    )
+    conn.commit()
+    cache_catalogo.invalidar()
+    return jsonify({'message': 'Produtos importados com sucesso!', 'importados': len(registros)})
+
+@app.route('/api/produtos/exportar', methods=['GET'])
+def exportar_produtos():
+    """Exporta todos os produtos em streaming (?formato=csv|ndjson)."""
+    colunas = list(CAMPOS_PRODUTO)
+    query = f"SELECT {', '.join(colunas)} FROM produtos ORDER BY id"
+    return _resposta_exportacao(query, (), request.args.get('formato', 'csv'), 'produtos', colunas)
+
 # --- API para Condomínios ---
+COLUNAS_CONDOMINIOS = {c: c for c in ('id', 'nome', 'responsavel', 'endereco', 'investimento', 'despesas_fixas')}
+
 @app.route('/api/condominios', methods=['GET', 'POST'])
 def handle_condominios():
-    """Lida com a listagem e criação de condomínios."""
+    """Lida com a listagem e criação de condomínios (GET aceita os parâmetros de listagem paginada)."""
     conn = get_db_connection()
     if request.method == 'POST':
         data = request.get_json()
@@ -115,13 +350,16 @@ def handle_condominios():
             (data['nome'], data['responsavel'], data['endereco'], data['investimento'])
         )
         conn.commit()
-        conn.close()
+        cache_catalogo.invalidar()
         return jsonify({'message': 'Condomínio criado com sucesso!'}), 201
     
-    # GET
-    condominios = conn.execute('SELECT * FROM condominios ORDER BY nome').fetchall()
-    conn.close()
-    return jsonify([dict(c) for c in condominios])
+    if _listagem_paginada():
+        filtros, params = _filtro_prefixo('nome')
+        return _listar('condominios', COLUNAS_CONDOMINIOS, ('nome COLLATE NOCASE', 'id'), filtros, params)
+
+    # GET (servido do cache do catálogo)
+    catalogo = cache_catalogo.obter(conn)
+    return _resposta_catalogo(catalogo.condominios_json, catalogo.etag_condominios)
 
 @app.route('/api/condominios/<int:id>', methods=['DELETE'])
 def delete_condominio(id):
@@ -129,14 +367,29 @@ def delete_condominio(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM condominios WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
+    cache_catalogo.invalidar()
     return jsonify({'message': 'Condomínio apagado com sucesso!'})
     
 # --- API de Estoque ---
+COLUNAS_ESTOQUE = {
+    'id': 'e.id',
+    'produtoNome': 'p.nome',
+    'quantidade': 'e.quantidade',
+    'limite_critico': 'e.limite_critico',
+    'produto_id': 'e.produto_id',
+}
+
 @app.route('/api/estoque/<int:condo_id>', methods=['GET'])
 def get_estoque(condo_id):
-    """Pega o estoque de um condomínio específico."""
-    conn = get_db_connection()
+    """Pega o estoque de um condomínio específico (aceita os parâmetros de listagem paginada)."""
+    if _listagem_paginada():
+        filtros, params = _filtro_prefixo('p.nome')
+        return _listar(
+            'estoque e JOIN produtos p ON e.produto_id = p.id', COLUNAS_ESTOQUE, ('p.nome', 'e.id'),
+            ['e.condominio_id = ?'] + filtros, [condo_id] + params
+        )
+
+    conn = get_db_leitura()
     query = """
     SELECT e.id, p.nome as produtoNome, e.quantidade, e.limite_critico, e.produto_id
     FROM estoque e
@@ -145,8 +398,7 @@ def get_estoque(condo_id):
     ORDER BY p.nome
     """
     estoque = conn.execute(query, (condo_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(e) for e in estoque])
+    return resposta_json(estoque)
 
 @app.route('/api/estoque', methods=['POST'])
 def add_estoque():
@@ -158,26 +410,17 @@ def add_estoque():
     limite_critico = data['limiteCritico']
 
     conn = get_db_connection()
-    # Verifica se já existe para decidir entre INSERT ou UPDATE
-    item_existente = conn.execute(
-        'SELECT id, quantidade FROM estoque WHERE condominio_id = ? AND produto_id = ?',
-        (condo_id, produto_id)
-    ).fetchone()
-
-    if item_existente:
-        nova_quantidade = item_existente['quantidade'] + quantidade
-        conn.execute(
-            'UPDATE estoque SET quantidade = ?, limite_critico = ? WHERE id = ?',
-            (nova_quantidade, limite_critico, item_existente['id'])
-        )
-    else:
-        conn.execute(
-            'INSERT INTO estoque (condominio_id, produto_id, quantidade, limite_critico) VALUES (?, ?, ?, ?)',
-            (condo_id, produto_id, quantidade, limite_critico)
-        )
-    
+    # UPSERT: um único comando atômico cria o item ou soma à quantidade existente
+    conn.execute(
+        '''
+        INSERT INTO estoque (condominio_id, produto_id, quantidade, limite_critico) VALUES (?, ?, ?, ?)
+        ON CONFLICT (condominio_id, produto_id) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            limite_critico = excluded.limite_critico
+        ''',
+        (condo_id, produto_id, quantidade, limite_critico)
+    )
     conn.commit()
-    conn.close()
     return jsonify({'message': 'Estoque atualizado com sucesso!'})
 
 @app.route('/api/estoque/repor', methods=['PUT'])
@@ -188,13 +431,9 @@ def repor_estoque():
     quantidade_adicional = data['quantidade']
 
     conn = get_db_connection()
-    item_atual = conn.execute('SELECT quantidade FROM estoque WHERE id = ?', (estoque_id,)).fetchone()
-    
-    if item_atual:
-        nova_quantidade = item_atual['quantidade'] + quantidade_adicional
-        conn.execute('UPDATE estoque SET quantidade = ? WHERE id = ?', (nova_quantidade, estoque_id))
-        conn.commit()
-    conn.close()
+    # Soma direto no banco, sem ler a quantidade antes (evita perder atualizações concorrentes)
+    conn.execute('UPDATE estoque SET quantidade = quantidade + ? WHERE id = ?', (quantidade_adicional, estoque_id))
+    conn.commit()
     return jsonify({'message': 'Estoque reposto!'})
 
 
@@ -204,9 +443,56 @@ def delete_estoque_item(id):
     conn = get_db_connection()
     conn.execute('DELETE FROM estoque WHERE id = ?', (id,))
     conn.commit()
-    conn.close()
     return jsonify({'message': 'Item removido do estoque.'})
 
+@app.route('/api/estoque/importar', methods=['POST'])
+def importar_estoque():
+    """Importa itens de estoque em massa (CSV ou lista JSON) em uma única transação.
+
+    ?modo=substituir (padrão) grava a quantidade informada; ?modo=somar soma à
+    quantidade atual, como o POST /api/estoque. Se alguma linha for inválida,
+    nada é gravado.
+    """
+    modo = request.args.get('modo', 'substituir')
+    if modo not in ('substituir', 'somar'):
+        return jsonify({'error': 'Modo inválido.'}), 400
+    registros, erros = validar_linhas(ler_linhas(request), CAMPOS_ESTOQUE)
+
+    conn = get_db_connection()
+    condominios = {r['id'] for r in conn.execute('SELECT id FROM condominios')}
+    produtos = {r['id'] for r in conn.execute('SELECT id FROM produtos')}
+    for numero, registro in registros:
+        if registro['condominio_id'] not in condominios:
+            erros.append({'linha': numero, 'erro': f"condomínio {registro['condominio_id']} não existe"})
+        elif registro['produto_id'] not in produtos:
+            erros.append({'linha': numero, 'erro': f"produto {registro['produto_id']} não existe"})
+    if erros:
+        return jsonify({'error': 'Importação rejeitada.', 'erros': sorted(erros, key=lambda e: e['linha'])}), 400
+
+    nova_quantidade = 'quantidade + excluded.quantidade' if modo == 'somar' else 'excluded.quantidade'
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany(
+        f'''
+        INSERT INTO estoque (condominio_id, produto_id, quantidade, limite_critico)
+        VALUES (:condominio_id, :produto_id, :quantidade, :limite_critico)
+        ON CONFLICT (condominio_id, produto_id) DO UPDATE SET
+            quantidade = {nova_quantidade},
+            limite_critico = excluded.limite_critico
+        ''',
+        [registro for _, registro in registros]
+    )
+    conn.commit()
+    return jsonify({'message': 'Estoque importado com sucesso!', 'importados': len(registros)})
+
+@app.route('/api/estoque/exportar', methods=['GET'])
+def exportar_estoque():
+    """Exporta o estoque em streaming (?formato=csv|ndjson, ?condominio_id= opcional)."""
+    colunas = list(CAMPOS_ESTOQUE)
+    condo_id = request.args.get('condominio_id', type=int)
+    where, params = ('WHERE condominio_id = ?', (condo_id,)) if condo_id else ('', ())
+    query = f"SELECT {', '.join(colunas)} FROM estoque {where} ORDER BY condominio_id, produto_id"
+    return _resposta_exportacao(query, params, request.args.get('formato', 'csv'), 'estoque', colunas)
+
 # --- API de Vendas ---
 @app.route('/api/vendas', methods=['POST'])
 def registrar_venda():
@@ -216,25 +502,41 @@ def registrar_venda():
     produto_id = data['produtoId']
     quantidade_vendida = data['quantidade']
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Pega informações do estoque e do produto
-    estoque_item = cursor.execute('SELECT * FROM estoque WHERE condominio_id = ? AND produto_id = ?', (condo_id, produto_id)).fetchone()
-    if not estoque_item or estoque_item['quantidade'] < quantidade_vendida:
-        conn.close()
+    if gravador is not None:
+        # Entra no próximo micro-lote da thread gravadora
+        vendida = gravador.executar(_aplicar_venda, condo_id, produto_id, quantidade_vendida)
+    else:
+        conn = get_db_connection()
+        # Reserva a escrita já no início: evita que duas vendas leiam o mesmo estoque
+        conn.execute('BEGIN IMMEDIATE')
+        vendida = _aplicar_venda(conn, condo_id, produto_id, quantidade_vendida)
+        if vendida:
+            conn.commit() # Salva todas as alterações (estoque, venda e caixa) de uma vez
+        else:
+            conn.rollback()
+
+    if not vendida:
         return jsonify({'error': 'Estoque insuficiente.'}), 400
-        
-    produto = cursor.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+    return jsonify({'message': 'Venda registrada com sucesso!'})
+
+def _aplicar_venda(conn, condo_id, produto_id, quantidade_vendida):
+    """Baixa o estoque e grava a venda e o lucro (sem commit). False se não houver estoque."""
+    produto = conn.execute('SELECT * FROM produtos WHERE id = ?', (produto_id,)).fetchone()
+    if not produto:
+        return False
     
-    # 1. ATUALIZA O ESTOQUE
-    nova_quantidade = estoque_item['quantidade'] - quantidade_vendida
-    cursor.execute('UPDATE estoque SET quantidade = ? WHERE id = ?', (nova_quantidade, estoque_item['id']))
+    # 1. ATUALIZA O ESTOQUE, só se houver quantidade suficiente (decremento atômico)
+    cursor = conn.execute(
+        'UPDATE estoque SET quantidade = quantidade - ? WHERE condominio_id = ? AND produto_id = ? AND quantidade >= ?',
+        (quantidade_vendida, condo_id, produto_id, quantidade_vendida)
+    )
+    if cursor.rowcount == 0:
+        return False
     
     # 2. REGISTRA A VENDA NA TABELA DE VENDAS
     custo_total = produto['preco_custo'] * quantidade_vendida
     venda_total = produto['preco_venda'] * quantidade_vendida
-    cursor.execute(
+    conn.execute(
         'INSERT INTO vendas (condominio_id, produto_id, quantidade, preco_custo_total, preco_venda_total) VALUES (?, ?, ?, ?, ?)',
         (condo_id, produto_id, quantidade_vendida, custo_total, venda_total)
     )
@@ -243,23 +545,131 @@ def registrar_venda():
     lucro_da_venda = venda_total - custo_total
     if lucro_da_venda > 0:
         descricao_lucro = f"Lucro da venda de {quantidade_vendida}x {produto['nome']}"
-        cursor.execute(
+        conn.execute(
             'INSERT INTO caixa_transacoes (tipo, valor, descricao, responsavel) VALUES (?, ?, ?, ?)',
             ('entrada', lucro_da_venda, descricao_lucro, 'Sistema Automático')
         )
-    
-    conn.commit() # Salva todas as alterações (estoque, venda e caixa) de uma vez
-    conn.close()
-    
-    return jsonify({'message': 'Venda registrada com sucesso!'})
+    return True
+
+@app.route('/api/vendas/lote', methods=['POST'])
+def registrar_venda_lote():
+    """Registra todos os itens de um checkout em uma única transação.
+
+    Corpo: {"chaveIdempotencia": "...", "itens": [{"condominioId", "produtoId", "quantidade"}, ...]}.
+    Ou todos os itens são vendidos, ou nenhum. Repetir a mesma chave devolve a
+    resposta original sem registrar a venda de novo.
+    """
+    data = request.get_json()
+    chave = data.get('chaveIdempotencia')
+    itens = data.get('itens') or []
+    if not chave or not itens:
+        return jsonify({'error': 'Dados incompletos'}), 400
+
+    # Valida as linhas antes de abrir a transação e soma linhas repetidas do
+    # mesmo produto no mesmo condomínio
+    quantidades = {}
+    for item in itens:
+        if not isinstance(item, dict) or any(campo not in item for campo in ('condominioId', 'produtoId', 'quantidade')):
+            return jsonify({'error': 'Dados incompletos'}), 400
+        par, qtd = (item['condominioId'], item['produtoId']), item['quantidade']
+        if not all(type(v) is int for v in (*par, qtd)) or qtd <= 0:
+            return jsonify({'error': 'Item inválido: ids e quantidade devem ser inteiros positivos.', 'item': item}), 400
+        quantidades[par] = quantidades.get(par, 0) + qtd
+
+    conn = get_db_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        anterior = conn.execute('SELECT resposta FROM vendas_lote WHERE chave = ?', (chave,)).fetchone()
+        if anterior:
+            conn.rollback()
+            return jsonify(json.loads(anterior['resposta']))
+
+        # Valida o estoque de todos os itens com uma única consulta; o OR de
+        # igualdades usa o índice UNIQUE(condominio_id, produto_id) em vez de
+        # varrer o estoque com a transação de escrita aberta
+        pares = ' OR '.join('(e.condominio_id = ? AND e.produto_id = ?)' for _ in quantidades)
+        estoque = {
+            (e['condominio_id'], e['produto_id']): e
+            for e in conn.execute(f"""
+                SELECT e.id, e.condominio_id, e.produto_id, e.quantidade,
+                       p.nome, p.preco_custo, p.preco_venda
+                FROM estoque e
+                JOIN produtos p ON e.produto_id = p.id
+                WHERE {pares}
+                """, [v for par in quantidades for v in par])
+        }
+        faltando = [
+            {'condominioId': condo_id, 'produtoId': produto_id}
+            for (condo_id, produto_id), qtd in quantidades.items()
+            if (condo_id, produto_id) not in estoque or estoque[(condo_id, produto_id)]['quantidade'] < qtd
+        ]
+        if faltando:
+            conn.rollback()
+            return jsonify({'error': 'Estoque insuficiente.', 'itens': faltando}), 400
+
+        baixas, vendas, lucro_total = [], [], 0
+        for par, qtd in quantidades.items():
+            item = estoque[par]
+            custo_total = item['preco_custo'] * qtd
+            venda_total = item['preco_venda'] * qtd
+            baixas.append((qtd, item['id'], qtd))
+            vendas.append((par[0], par[1], qtd, custo_total, venda_total))
+            if venda_total - custo_total > 0:
+                lucro_total += venda_total - custo_total
+
+        cursor = conn.executemany(
+            'UPDATE estoque SET quantidade = quantidade - ? WHERE id = ? AND quantidade >= ?', baixas
+        )
+        if cursor.rowcount != len(baixas):
+            raise sqlite3.IntegrityError('Estoque alterado durante a venda em lote.')
+        conn.executemany(
+            'INSERT INTO vendas (condominio_id, produto_id, quantidade, preco_custo_total, preco_venda_total) VALUES (?, ?, ?, ?, ?)',
+            vendas
+        )
+        # Um único lançamento no caixa com o lucro somado do checkout
+        if lucro_total > 0:
+            unidades = sum(quantidades.values())
+            conn.execute(
+                'INSERT INTO caixa_transacoes (tipo, valor, descricao, responsavel) VALUES (?, ?, ?, ?)',
+                ('entrada', lucro_total, f"Lucro da venda em lote de {unidades} itens", 'Sistema Automático')
+            )
+
+        resposta = {'message': 'Venda registrada com sucesso!', 'itens': len(vendas), 'lucro': lucro_total}
+        conn.execute('INSERT INTO vendas_lote (chave, resposta) VALUES (?, ?)', (chave, json.dumps(resposta)))
+        conn.commit() # Um único commit (e fsync) para o checkout inteiro
+    except Exception:
+        conn.rollback()
+        raise
+
+    return jsonify(resposta)
 
 
 
 # --- API de Relatórios e Análises ---
+COLUNAS_REPOSICAO = {
+    'estoqueId': 'e.id',
+    'produtoNome': 'p.nome',
+    'quantidade': 'e.quantidade',
+    'limite_critico': 'e.limite_critico',
+    'condominioNome': 'c.nome',
+    'endereco': 'c.endereco',
+}
+
 @app.route('/api/reposicao', methods=['GET'])
 def get_reposicao_list():
-    """Gera a lista de produtos que precisam de reposição."""
-    conn = get_db_connection()
+    """Gera a lista de produtos que precisam de reposição (via índice parcial de estoque baixo).
+
+    Aceita os parâmetros de listagem paginada; ?nome= filtra pelo nome do produto.
+    """
+    if _listagem_paginada():
+        filtros, params = _filtro_prefixo('p.nome')
+        return _listar(
+            'estoque e JOIN produtos p ON e.produto_id = p.id JOIN condominios c ON e.condominio_id = c.id',
+            COLUNAS_REPOSICAO, ('c.nome', 'p.nome', 'e.id'),
+            ['e.quantidade <= e.limite_critico'] + filtros, params
+        )
+
+    conn = get_db_leitura()
     query = """
     SELECT p.nome as produtoNome, e.quantidade, e.limite_critico, c.nome as condominioNome, c.endereco
     FROM estoque e
@@ -269,9 +679,136 @@ def get_reposicao_list():
     ORDER BY c.nome, p.nome
     """
     itens = conn.execute(query).fetchall()
-    conn.close()
-    return jsonify([dict(i) for i in itens])
+    return resposta_json(itens)
+
+@app.route('/api/reposicao/previsao', methods=['GET'])
+def get_previsao_reposicao():
+    """Plano de reposição pela previsão de ruptura, ordenado por condomínio e endereço.
+
+    Inclui os itens já abaixo do limite crítico e os que devem acabar em até
+    ?horizonte= dias (padrão 3). A sugestão de reposição cobre ?cobertura= dias
+    de vendas (padrão 7) mais o limite crítico.
+    """
+    horizonte = max(1, min(request.args.get('horizonte', 3, type=int), 30))
+    cobertura = max(1, min(request.args.get('cobertura', 7, type=int), 60))
+    plano = cache_previsao.obter(get_db_leitura(), horizonte, cobertura)
+    return resposta_json(plano)
 
+SSE_INTERVALO = float(os.environ.get("SSE_INTERVALO", "1"))  # segundos entre consultas de eventos
+SSE_HEARTBEAT = 15  # segundos sem eventos até mandar um comentário de keep-alive
+# Segundos até o servidor fechar o stream; o navegador reconecta sozinho com
+# Last-Event-ID, e a thread do worker não fica presa para sempre a um cliente
+SSE_DURACAO_MAX = float(os.environ.get("SSE_DURACAO_MAX", "300"))
+
+@app.route('/api/reposicao/stream', methods=['GET'])
+def stream_reposicao():
+    """Server-Sent Events: avisa quando um item cruza o limite crítico ou é reposto.
+
+    Cada evento tem `id` sequencial; o navegador reenvia o último recebido em
+    Last-Event-ID ao reconectar. O stream fecha depois de SSE_DURACAO_MAX
+    segundos; cada cliente conectado ocupa uma thread (ver gunicorn.conf.py).
+    """
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    if ultimo_id is None:
+        ultimo_id = get_db_leitura().execute('SELECT IFNULL(MAX(id), 0) FROM eventos_estoque').fetchone()[0]
+    return Response(_eventos_reposicao(ultimo_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _eventos_reposicao(ultimo_id):
+    query = """
+    SELECT ev.id, ev.tipo, ev.estoque_id, ev.quantidade, ev.limite_critico,
+           p.nome as produtoNome, c.nome as condominioNome, c.endereco
+    FROM eventos_estoque ev
+    JOIN estoque e ON ev.estoque_id = e.id
+    JOIN produtos p ON e.produto_id = p.id
+    JOIN condominios c ON e.condominio_id = c.id
+    WHERE ev.id > ?
+    ORDER BY ev.id
+    LIMIT 100
+    """
+    # Primeira mensagem imediata: envia os cabeçalhos e o intervalo de reconexão
+    yield 'retry: 3000\n\n'
+    ocioso = 0
+    prazo = time.monotonic() + SSE_DURACAO_MAX
+    while time.monotonic() < prazo:
+        # Pega a conexão só durante a consulta, para não prender o pool com clientes
+        # conectados; o pool de leitura não disputa conexões com as vendas
+        conn = pool_leitura.obter()
+        try:
+            eventos = conn.execute(query, (ultimo_id,)).fetchall()
+        finally:
+            pool_leitura.devolver(conn)
+        for ev in eventos:
+            ultimo_id = ev['id']
+            yield f"id: {ev['id']}\nevent: {ev['tipo']}\ndata: {json.dumps(dict(ev), ensure_ascii=False)}\n\n"
+        if eventos:
+            ocioso = 0
+            continue
+        ocioso += SSE_INTERVALO
+        if ocioso >= SSE_HEARTBEAT:
+            ocioso = 0
+            yield ': keep-alive\n\n'
+        time.sleep(SSE_INTERVALO)
+
+
+def _calcular_financeiro(investimento_inicial, despesas_fixas, faturamento, custo_produtos):
+    """Campos financeiros de um condomínio a partir dos seus totais de vendas."""
+    # Cálculos principais
+    lucro_bruto = faturamento - custo_produtos
+    lucro_liquido = lucro_bruto - despesas_fixas
+    comissao = lucro_liquido * 0.02 if lucro_liquido > 0 else 0
+    
+    # (NOVO!) Cálculo do investimento restante a ser recuperado
+    investimento_restante = investimento_inicial - lucro_bruto
+    
+    return {
+        'investimentoInicial': investimento_inicial, # Enviando o valor original
+        'investimentoRestante': investimento_restante, # (NOVO!) Enviando o valor a recuperar
+        'despesas': despesas_fixas,
+        'faturamento': faturamento, # (NOVO!) Enviando o faturamento total
+        'lucroBruto': lucro_bruto, # Enviando o lucro bruto para a barra de progresso
+        'lucroLiquido': lucro_liquido,
+        'comissao': comissao
+    }
+
+MUDANCAS_ESPERA_MAX = 30  # segundos de long-poll
+MUDANCAS_INTERVALO = float(os.environ.get("MUDANCAS_INTERVALO", "0.5"))  # segundos entre consultas
+
+@app.route('/api/mudancas', methods=['GET'])
+def get_mudancas():
+    """Mudanças em produtos, condomínios, estoque e caixa desde o cursor ?desde=<seq>.
+
+    Sem ?desde, devolve só o cursor atual (pegue-o antes de baixar as listas
+    completas). Filtros: ?condominio_id= e ?tabelas=a,b. Com ?esperar=N (até 30 s)
+    a resposta aguarda até surgir alguma mudança (long-poll; ocupa uma thread
+    do worker durante a espera, ver gunicorn.conf.py). Se o cursor for antigo demais, responde 410 e o
+    cliente deve baixar as listas completas de novo.
+    """
+    desde = request.args.get('desde', type=int)
+    if desde is None:
+        return resposta_json({'mudancas': [], 'proximo': cursor_atual(get_db_leitura()), 'tem_mais': False})
+    tabelas = request.args.get('tabelas')
+    tabelas = tuple(tabelas.split(',')) if tabelas else TABELAS_MUDANCAS
+    if any(t not in TABELAS_MUDANCAS for t in tabelas):
+        return jsonify({'error': 'Tabela inválida.'}), 400
+    condo_id = request.args.get('condominio_id', type=int)
+    limite = _ler_limite(padrao=500)
+    espera = max(0, min(request.args.get('esperar', 0, type=float), MUDANCAS_ESPERA_MAX))
+
+    prazo = time.monotonic() + espera
+    while True:
+        # Pega a conexão só durante a consulta, para não prender o pool durante a espera
+        conn = pool_leitura.obter()
+        try:
+            mudancas, proximo, tem_mais = ler_mudancas(conn, desde, limite, condo_id, tabelas)
+        except ResincronizacaoNecessaria as e:
+            return jsonify({'error': str(e), 'resincronizar': True, 'proximo': e.atual}), 410
+        finally:
+            pool_leitura.devolver(conn)
+        if mudancas or time.monotonic() >= prazo:
+            return resposta_json({'mudancas': mudancas, 'proximo': proximo, 'tem_mais': tem_mais})
+        desde = proximo  # pula as mudanças descartadas pelos filtros
+        time.sleep(MUDANCAS_INTERVALO)
 
 @app.route('/api/financeiro/<int:condo_id>', methods=['GET'])
 def get_financeiro_condo(condo_id):
@@ -286,44 +823,98 @@ def get_financeiro_condo(condo_id):
     investimento_inicial = condo['investimento'] if condo else 0
     despesas_fixas = condo['despesas_fixas'] if condo else 0.00
     
-    vendas = conn.execute(
-        'SELECT SUM(preco_venda_total) as faturamento, SUM(preco_custo_total) as custo_total FROM vendas WHERE condominio_id = ?',
+    # Totais mantidos pelo trigger de vendas: consulta O(1) pela chave primária
+    totais = conn.execute(
+        'SELECT faturamento, custo_total FROM totais_condominio WHERE condominio_id = ?',
         (condo_id,)
     ).fetchone()
     
-    conn.close()
-    
-    faturamento = vendas['faturamento'] or 0
-    custo_produtos = vendas['custo_total'] or 0
+    faturamento = totais['faturamento'] if totais else 0
+    custo_produtos = totais['custo_total'] if totais else 0
     
-    # Cálculos principais
-    lucro_bruto = faturamento - custo_produtos
-    lucro_liquido = lucro_bruto - despesas_fixas
-    comissao = lucro_liquido * 0.02 if lucro_liquido > 0 else 0
-    
-    # (NOVO!) Cálculo do investimento restante a ser recuperado
-    investimento_restante = investimento_inicial - lucro_bruto
-    
-    return jsonify({
-        'investimentoInicial': investimento_inicial, # Enviando o valor original
-        'investimentoRestante': investimento_restante, # (NOVO!) Enviando o valor a recuperar
-        'despesas': despesas_fixas,
-        'faturamento': faturamento, # (NOVO!) Enviando o faturamento total
-        'lucroBruto': lucro_bruto, # Enviando o lucro bruto para a barra de progresso
-        'lucroLiquido': lucro_liquido,
-        'comissao': comissao
-    })
+    return jsonify(_calcular_financeiro(investimento_inicial, despesas_fixas, faturamento, custo_produtos))
+
+ORDENACOES_FINANCEIRO = ('nome', 'lucroLiquido', 'investimentoRestante', 'faturamento')
+
+@app.route('/api/financeiro', methods=['GET'])
+def get_financeiro_frota():
+    """Dados financeiros de todos os condomínios em uma única consulta agrupada.
+
+    ?ordenar=nome|lucroLiquido|investimentoRestante|faturamento (padrão: nome),
+    ?ordem=asc|desc. Com ?inicio= e/ou ?fim= (AAAA-MM-DD), faturamento e custo
+    vêm só das vendas do período (tabela vendas_diarias).
+    """
+    ordenar = request.args.get('ordenar', 'nome')
+    ordem = request.args.get('ordem', 'asc')
+    data_inicio = request.args.get('inicio')
+    data_fim = request.args.get('fim')
+    if ordenar not in ORDENACOES_FINANCEIRO or ordem not in ('asc', 'desc'):
+        return jsonify({'error': 'Ordenação inválida.'}), 400
+
+    if data_inicio or data_fim:
+        filtros, params = [], []
+        if data_inicio:
+            filtros.append('dia >= ?')
+            params.append(data_inicio)
+        if data_fim:
+            filtros.append('dia <= ?')
+            params.append(data_fim)
+        totais = f"""
+        SELECT condominio_id, SUM(faturamento) as faturamento, SUM(custo_total) as custo_total
+        FROM vendas_diarias WHERE {' AND '.join(filtros)} GROUP BY condominio_id
+        """
+    else:
+        # Sem período: os totais mantidos pelo trigger de vendas
+        totais, params = 'SELECT condominio_id, faturamento, custo_total FROM totais_condominio', []
+
+    conn = get_db_leitura()
+    linhas = conn.execute(f"""
+    SELECT c.id, c.nome, c.investimento, c.despesas_fixas,
+           IFNULL(t.faturamento, 0) as faturamento, IFNULL(t.custo_total, 0) as custo_total
+    FROM condominios c
+    LEFT JOIN ({totais}) t ON t.condominio_id = c.id
+    """, params).fetchall()
+
+    frota = [
+        {'id': l['id'], 'nome': l['nome'],
+         **_calcular_financeiro(l['investimento'], l['despesas_fixas'], l['faturamento'], l['custo_total'])}
+        for l in linhas
+    ]
+    frota.sort(key=lambda c: (c[ordenar], c['id']), reverse=(ordem == 'desc'))
+    return resposta_json(frota)
 
 
     
+RELATORIO_VENDAS_COLUNAS = [
+    'data_venda', 'condominioNome', 'produtoNome', 'quantidade',
+    'preco_venda_total', 'preco_custo_total', 'lucro'
+]
+RELATORIO_LOTE = 500  # linhas lidas do cursor por vez no modo streaming
+
 @app.route('/api/relatorios/vendas', methods=['GET'])
 def get_relatorio_vendas():
-    """Gera um relatório de vendas por período."""
+    """Gera um relatório de vendas por período.
+
+    Filtros opcionais: ?condominio_id= e ?produto_id=. Com ?formato=csv ou
+    ?formato=ndjson a resposta é enviada em streaming, lote a lote. Meses já
+    arquivados são lidos dos arquivos mensais, na ordem cronológica.
+    """
     data_inicio = request.args.get('inicio')
     data_fim = request.args.get('fim')
+    condo_id = request.args.get('condominio_id', type=int)
+    produto_id = request.args.get('produto_id', type=int)
+    formato = request.args.get('formato', 'json')
     
-    conn = get_db_connection()
-    query = """
+    filtros = ['v.data_venda BETWEEN ? AND ?']
+    params = [f'{data_inicio} 00:00:00', f'{data_fim} 23:59:59']
+    if condo_id:
+        filtros.append('v.condominio_id = ?')
+        params.append(condo_id)
+    if produto_id:
+        filtros.append('v.produto_id = ?')
+        params.append(produto_id)
+
+    query = f"""
     SELECT 
         v.data_venda, 
         c.nome as condominioNome, 
@@ -332,15 +923,129 @@ def get_relatorio_vendas():
         v.preco_venda_total, 
         v.preco_custo_total,
         (v.preco_venda_total - v.preco_custo_total) as lucro
-    FROM vendas v
+    FROM {{fonte}} v
     JOIN condominios c ON v.condominio_id = c.id
     JOIN produtos p ON v.produto_id = p.id
-    WHERE v.data_venda BETWEEN ? AND ?
+    WHERE {' AND '.join(filtros)}
     ORDER BY v.data_venda
     """
-    vendas = conn.execute(query, (f'{data_inicio} 00:00:00', f'{data_fim} 23:59:59')).fetchall()
-    conn.close()
-    return jsonify([dict(v) for v in vendas])
+
+    def fontes(conn):
+        return fontes_vendas(conn, data_inicio, data_fim, pool_conexoes.db_file)
+
+    if formato in ('csv', 'ndjson'):
+        return _resposta_exportacao(
+            query, params, formato, 'relatorio_vendas', RELATORIO_VENDAS_COLUNAS, fontes, fonte_analises
+        )
+
+    conn = get_db_analises()
+    vendas = []
+    for fonte in fontes(conn):
+        vendas += conn.execute(query.format(fonte=fonte), params).fetchall()
+    return resposta_json(vendas)
+
+def _resposta_exportacao(query, params, formato, nome_arquivo, colunas, fontes=None, origem=None):
+    """Resposta em streaming, em CSV ou NDJSON, com o resultado de uma consulta."""
+    if formato == 'ndjson':
+        return Response(
+            _stream_relatorio(query, params, _linhas_ndjson, fontes=fontes, origem=origem),
+            mimetype='application/x-ndjson'
+        )
+    return Response(
+        _stream_relatorio(query, params, _linhas_csv, _linhas_csv([colunas]), fontes, origem),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.csv'}
+    )
+
+def _linhas_csv(lote):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(lote)
+    return buffer.getvalue()
+
+def _linhas_ndjson(lote):
+    return ''.join(json.dumps(dict(linha), ensure_ascii=False) + '\n' for linha in lote)
+
+def _stream_relatorio(query, params, formatar, cabecalho=None, fontes=None, origem=None):
+    """Percorre o cursor em lotes, mantendo a memória constante para qualquer período.
+
+    Usa uma conexão própria de `origem` (padrão: o pool somente leitura), pois o
+    gerador continua rodando depois que a função da rota já retornou. Com
+    `fontes(conn)`, a consulta roda uma vez para cada tabela gerada, no lugar de {fonte}.
+    """
+    origem = origem or pool_leitura
+    conn = origem.obter()
+    try:
+        if cabecalho:
+            yield cabecalho
+        for fonte in fontes(conn) if fontes else [None]:
+            cursor = conn.execute(query.format(fonte=fonte) if fonte else query, params)
+            try:
+                lote = cursor.fetchmany(RELATORIO_LOTE)
+                while lote:
+                    yield formatar(lote)
+                    lote = cursor.fetchmany(RELATORIO_LOTE)
+            finally:
+                cursor.close()  # libera o arquivo anexado antes do DETACH
+    finally:
+        origem.devolver(conn)
+
+# Expressões SQL que levam o dia do resumo ao início do período
+PERIODOS_RESUMO = {
+    'dia': 'r.dia',
+    'semana': "date(r.dia, 'weekday 0', '-6 days')",  # segunda-feira da semana
+    'mes': "strftime('%Y-%m', r.dia)",
+}
+DIMENSOES_RESUMO = {
+    'condominio': ('r.condominio_id', 'c.nome', 'JOIN condominios c ON r.condominio_id = c.id'),
+    'produto': ('r.produto_id', 'p.nome', 'JOIN produtos p ON r.produto_id = p.id'),
+}
+
+@app.route('/api/relatorios/resumo', methods=['GET'])
+def get_relatorio_resumo():
+    """Totais de vendas agrupados por período, a partir da tabela vendas_diarias.
+
+    ?agrupar=dia|semana|mes (padrão: dia), ?por=condominio|produto (opcional),
+    ?inicio= e ?fim= no formato AAAA-MM-DD.
+    """
+    agrupar = request.args.get('agrupar', 'dia')
+    por = request.args.get('por')
+    data_inicio = request.args.get('inicio')
+    data_fim = request.args.get('fim')
+    if agrupar not in PERIODOS_RESUMO or (por and por not in DIMENSOES_RESUMO):
+        return jsonify({'error': 'Agrupamento inválido.'}), 400
+
+    colunas = [f"{PERIODOS_RESUMO[agrupar]} as periodo"]
+    grupo = ['periodo']
+    juncao = ''
+    if por:
+        chave, nome, juncao = DIMENSOES_RESUMO[por]
+        colunas += [f'{chave} as {por}Id', f'{nome} as {por}Nome']
+        grupo.append(chave)
+
+    filtros, params = [], []
+    if data_inicio:
+        filtros.append('r.dia >= ?')
+        params.append(data_inicio)
+    if data_fim:
+        filtros.append('r.dia <= ?')
+        params.append(data_fim)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+
+    query = f"""
+    SELECT {', '.join(colunas)},
+           SUM(r.unidades) as unidades,
+           SUM(r.faturamento) as faturamento,
+           SUM(r.custo_total) as custo,
+           SUM(r.lucro) as lucro
+    FROM vendas_diarias r
+    {juncao}
+    {where}
+    GROUP BY {', '.join(grupo)}
+    ORDER BY {', '.join(grupo)}
+    """
+    conn = get_db_analises()
+    linhas = conn.execute(query, params).fetchall()
+    return resposta_json(linhas)
 
 @app.route('/api/condominios/<int:id>/despesas', methods=['PUT'])
 def update_despesas_condo(id):
@@ -354,31 +1059,59 @@ def update_despesas_condo(id):
     conn = get_db_connection()
     conn.execute('UPDATE condominios SET despesas_fixas = ? WHERE id = ?', (novo_valor, id))
     conn.commit()
-    conn.close()
+    cache_catalogo.invalidar()
     return jsonify({'message': 'Despesas atualizadas com sucesso!'})
 
 @app.route('/api/caixa', methods=['GET'])
 def get_caixa_info():
-    """Busca as transações e o saldo atual do caixa."""
-    conn = get_db_connection()
-    
+    """Busca uma página de transações e o saldo atual do caixa.
+
+    Paginação por chave: ?antes_de=<id>&limite=N, com filtros opcionais
+    ?tipo=entrada|saida e ?inicio=/&fim= (AAAA-MM-DD).
+    """
+    antes_de = request.args.get('antes_de', type=int)
+    tipo = request.args.get('tipo')
+    data_inicio = request.args.get('inicio')
+    data_fim = request.args.get('fim')
+    limite = _ler_limite()
+
+    filtros, params = [], []
+    if antes_de:
+        filtros.append('id < ?')
+        params.append(antes_de)
+    if tipo:
+        filtros.append('tipo = ?')
+        params.append(tipo)
+    if data_inicio:
+        filtros.append('data_transacao >= ?')
+        params.append(f'{data_inicio} 00:00:00')
+    if data_fim:
+        filtros.append('data_transacao <= ?')
+        params.append(f'{data_fim} 23:59:59')
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ''
+
+    conn = get_db_leitura()
+    # Busca um item a mais só para saber se existe uma próxima página
     transacoes = conn.execute(
-        'SELECT * FROM caixa_transacoes ORDER BY data_transacao DESC'
+        f'SELECT * FROM caixa_transacoes {where} ORDER BY id DESC LIMIT ?',
+        (*params, limite + 1)
     ).fetchall()
+    tem_mais = len(transacoes) > limite
+    transacoes = transacoes[:limite]
     
-    saldo = conn.execute(
-        """
-        SELECT 
-            (SELECT IFNULL(SUM(valor), 0) FROM caixa_transacoes WHERE tipo = 'entrada') - 
-            (SELECT IFNULL(SUM(valor), 0) FROM caixa_transacoes WHERE tipo = 'saida')
-        """
-    ).fetchone()[0]
-    
-    conn.close()
+    # O saldo atual é o saldo gravado na última transação (ou o saldo arquivado)
+    saldo = conn.execute('''
+        SELECT COALESCE(
+            (SELECT saldo_apos FROM caixa_transacoes ORDER BY id DESC LIMIT 1),
+            (SELECT saldo_caixa FROM arquivamento WHERE id = 1),
+            0
+        )
+    ''').fetchone()[0]
     
-    return jsonify({
+    return resposta_json({
         'saldo_atual': saldo,
-        'transacoes': [dict(t) for t in transacoes]
+        'transacoes': [dict(t) for t in transacoes],
+        'proximo_antes_de': transacoes[-1]['id'] if tem_mais else None
     })
 
 @app.route('/api/caixa/transacao', methods=['POST'])
@@ -399,78 +1132,22 @@ def add_caixa_transacao():
         (tipo, valor, descricao, responsavel)
     )
     conn.commit()
-    conn.close()
 
     return jsonify({'message': 'Transação registrada com sucesso!'}), 201
 
 @app.route('/webhook-mercadopago', methods=['POST'])
 def webhook_mercadopago():
-    """Recebe notificações de pagamento do Mercado Pago."""
+    """Recebe notificações de pagamento do Mercado Pago.
+
+    Só grava a notificação na caixa de entrada e responde na hora; a consulta
+    ao Mercado Pago e o registro das vendas rodam em segundo plano.
+    """
     data = request.get_json()
 
     if data and data.get('type') == 'payment':
-        payment_id = data['data']['id']
-        
-        # Substitua 'SEU_ACCESS_TOKEN' pela sua chave, se ainda não o fez
-        sdk = mercadopago.SDK("SEU_ACCESS_TOKEN") 
-        payment_info = sdk.payment().get(payment_id)
-        
-        # --- LINHAS DE DEBUG CORRIGIDAS ---
-        # A indentação aqui está correta, alinhada com o 'if' abaixo.
-        print("--- DADOS RECEBIDOS DO MERCADO PAGO ---")
-        print(payment_info)
-        print("-----------------------------------------")
-        
-        if payment_info["status"] == 200 and payment_info["response"]["status"] == "approved":
-            payment = payment_info["response"]
-            
-            # Loop através dos itens vendidos
-            for item in payment.get("additional_info", {}).get("items", []):
-                try:
-                    # Extrai o nome do produto e do condomínio
-                    parts = item['title'].strip().rsplit('(', 1)
-                    if len(parts) != 2:
-                        print(f"ERRO: Título do produto fora do padrão: {item['title']}")
-                        continue
-
-                    product_name = parts[0].strip()
-                    condo_name = parts[1].replace(')', '').strip()
-                    quantity_sold = int(item['quantity'])
-
-                    # Conecta ao nosso banco de dados local
-                    conn = get_db_connection()
-                    
-                    # Encontra o ID do produto e do condomínio no nosso sistema
-                    produto_db = conn.execute('SELECT id, preco_custo, preco_venda FROM produtos WHERE nome = ?', (product_name,)).fetchone()
-                    condo_db = conn.execute('SELECT id FROM condominios WHERE nome = ?', (condo_name,)).fetchone()
-
-                    if not produto_db or not condo_db:
-                        print(f"ERRO: Produto '{product_name}' ou Condomínio '{condo_name}' não encontrado no sistema.")
-                        conn.close() # Fecha a conexão antes de pular para o próximo item
-                        continue
-
-                    # Atualiza o estoque
-                    estoque_item = conn.execute('SELECT id, quantidade FROM estoque WHERE condominio_id = ? AND produto_id = ?', (condo_db['id'], produto_db['id'])).fetchone()
-                    if estoque_item and estoque_item['quantidade'] >= quantity_sold:
-                        nova_quantidade = estoque_item['quantidade'] - quantity_sold
-                        conn.execute('UPDATE estoque SET quantidade = ? WHERE id = ?', (nova_quantidade, estoque_item['id']))
-                        
-                        # Registra a venda
-                        custo_total = produto_db['preco_custo'] * quantity_sold
-                        venda_total = produto_db['preco_venda'] * quantity_sold
-                        conn.execute(
-                            'INSERT INTO vendas (condominio_id, produto_id, quantidade, preco_custo_total, preco_venda_total) VALUES (?, ?, ?, ?, ?)',
-                            (condo_db['id'], produto_db['id'], quantity_sold, custo_total, venda_total)
-                        )
-                        conn.commit()
-                        print(f"SUCESSO: Venda de {quantity_sold}x {product_name} no {condo_name} registrada.")
-                    else:
-                        print(f"ERRO DE ESTOQUE: Não foi possível registrar a venda de {product_name}.")
-                    
-                    conn.close()
-
-                except Exception as e:
-                    print(f"Ocorreu um erro ao processar o item: {e}")
+        enfileirar_notificacao(get_db_connection(), data['data']['id'])
+        processador_webhook.iniciar()  # garante as threads neste processo (ex.: após fork)
+        processador_webhook.notificar()
     
     # Responde ao Mercado Pago que recebemos a notificação com sucesso
     return jsonify({'status': 'ok'}), 200
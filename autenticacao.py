@@ -0,0 +1,116 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import database
+import metricas
+
+# --- Hash de senhas e tokens de sessão ---
+# O hash de senha é caro de propósito. Ele roda em um executor limitado
+# (HASH_CONCORRENCIA threads por processo) e, se a fila estiver cheia por mais
+# de HASH_ESPERA_MAX segundos, a requisição recebe 503 em vez de travar o worker.
+# Depois do login o cliente usa um token assinado, cuja verificação é só um HMAC.
+
+HASH_CONCORRENCIA = int(os.environ.get("HASH_CONCORRENCIA", "2"))
+HASH_FILA_MAX = int(os.environ.get("HASH_FILA_MAX", str(HASH_CONCORRENCIA * 4)))
+HASH_ESPERA_MAX = float(os.environ.get("HASH_ESPERA_MAX", "2"))
+SENHA_METODO = os.environ.get("SENHA_METODO", "scrypt:32768:8:1")
+TOKEN_VALIDADE = int(os.environ.get("TOKEN_VALIDADE", str(12 * 3600)))  # segundos
+# O werkzeug completa nomes curtos ('scrypt' -> 'scrypt:32768:8:1'); o prefixo
+# gravado nos hashes é comparado com a forma completa
+_PREFIXO_HASH = generate_password_hash('', method=SENHA_METODO).split('$', 1)[0]
+
+SECRET_KEY = os.environ.get("SECRET_KEY")
+
+
+class _Serializador:
+    """Serializador dos tokens, criado no primeiro uso.
+
+    Sem SECRET_KEY no ambiente, usa a chave gerada pela migração 015 e gravada
+    no banco, a mesma para todos os workers e entre reinícios.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._serializador = None
+
+    def __call__(self):
+        if self._serializador is None:
+            with self._lock:
+                if self._serializador is None:
+                    chave = SECRET_KEY or database.ler_configuracao('secret_key')
+                    if not chave:
+                        raise RuntimeError('Sem SECRET_KEY e sem chave de sessão no banco; rode as migrações.')
+                    self._serializador = URLSafeTimedSerializer(chave, salt='sessao')
+        return self._serializador
+
+
+_serializador = _Serializador()
+
+
+class ServidorOcupado(Exception):
+    """A fila de hash de senhas está cheia."""
+
+
+class _ExecutorDeHash:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _garantir(self):
+        # Threads não sobrevivem a um fork: recria o executor em cada worker
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=HASH_CONCORRENCIA, thread_name_prefix='hash-senha')
+                self._vagas = threading.BoundedSemaphore(HASH_FILA_MAX)
+
+    def executar(self, funcao, *args):
+        self._garantir()
+        if not self._vagas.acquire(timeout=HASH_ESPERA_MAX):
+            raise ServidorOcupado()
+        try:
+            return self._executor.submit(funcao, *args).result()
+        finally:
+            self._vagas.release()
+
+
+_executor = _ExecutorDeHash()
+
+
+def _gerar_hash(senha):
+    with metricas.cronometrar('hash_senha'):
+        return generate_password_hash(senha, method=SENHA_METODO)
+
+
+def _verificar(senha_hash, senha):
+    with metricas.cronometrar('verificar_senha'):
+        return check_password_hash(senha_hash, senha)
+
+
+def gerar_hash(senha):
+    return _executor.executar(_gerar_hash, senha)
+
+
+def verificar_senha(senha_hash, senha):
+    return _executor.executar(_verificar, senha_hash, senha)
+
+
+def precisa_rehash(senha_hash):
+    """True se o hash foi gerado com parâmetros diferentes de SENHA_METODO."""
+    return senha_hash.split('$', 1)[0] != _PREFIXO_HASH
+
+
+def emitir_token(usuario):
+    return _serializador().dumps({'id': usuario['id'], 'email': usuario['email'], 'role': usuario['role']})
+
+
+def ler_token(token):
+    """Devolve os dados do usuário ou None se o token for inválido ou expirado."""
+    try:
+        return _serializador().loads(token, max_age=TOKEN_VALIDADE)
+    except BadSignature:
+        return None
@@ -0,0 +1,215 @@
+"""Benchmark dos principais endpoints da API via Flask test client.
+
+Roda cada cenário com N requisições, de forma sequencial ou concorrente
+(várias threads), e mede latência p50/p95/p99 e vazão. O resultado é salvo em
+JSON; com --comparar, mostra a variação em relação a uma execução anterior.
+
+Uso:
+    python benchmarks/gerar_dados.py /tmp/bench --escala media
+    python benchmarks/executar.py /tmp/bench --requisicoes 500 --concorrencia 8 --saida resultado.json
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PagamentosFalsos:
+    """Substitui o cliente do Mercado Pago: todo pagamento é aprovado com um item."""
+
+    def __init__(self, itens):
+        self.itens = itens
+        self.rnd = random.Random(7)
+
+    def get(self, payment_id):
+        produto, condominio = self.rnd.choice(self.itens)
+        return {'status': 200, 'response': {
+            'status': 'approved',
+            'additional_info': {'items': [{'title': f'{produto} ({condominio})', 'quantity': '1'}]},
+        }}
+
+
+class Contexto:
+    """Dados do banco usados para montar requisições realistas."""
+
+    def __init__(self, db_file):
+        conn = sqlite3.connect(db_file)
+        self.estoque = conn.execute('SELECT condominio_id, produto_id FROM estoque').fetchall()
+        self.condominios = [r[0] for r in conn.execute('SELECT id FROM condominios')]
+        self.nomes = conn.execute("""
+            SELECT p.nome, c.nome FROM estoque e
+            JOIN produtos p ON e.produto_id = p.id
+            JOIN condominios c ON e.condominio_id = c.id
+        """).fetchall()
+        ultima = conn.execute('SELECT MAX(data_venda) FROM vendas').fetchone()[0]
+        conn.close()
+        self.fim = (datetime.datetime.fromisoformat(ultima) if ultima else datetime.datetime.now()).date()
+        self.pagamentos = itertools.count(1)
+
+
+def _venda(client, ctx, rnd):
+    condo_id, produto_id = rnd.choice(ctx.estoque)
+    return client.post('/api/vendas', json={'condominioId': condo_id, 'produtoId': produto_id, 'quantidade': 1})
+
+
+def _financeiro(client, ctx, rnd):
+    return client.get(f'/api/financeiro/{rnd.choice(ctx.condominios)}')
+
+
+def _financeiro_frota(client, ctx, rnd):
+    return client.get('/api/financeiro?ordenar=lucroLiquido&ordem=desc')
+
+
+def _caixa(client, ctx, rnd):
+    return client.get('/api/caixa')
+
+
+def _relatorio(client, ctx, rnd):
+    inicio = ctx.fim - datetime.timedelta(days=30)
+    return client.get(f'/api/relatorios/vendas?inicio={inicio}&fim={ctx.fim}')
+
+
+def _reposicao(client, ctx, rnd):
+    return client.get('/api/reposicao')
+
+
+def _previsao(client, ctx, rnd):
+    return client.get('/api/reposicao/previsao')
+
+
+def _webhook(client, ctx, rnd):
+    # Mede o ciclo completo: receber a notificação e processá-la com o SDK falso
+    from app import processador_webhook
+    resposta = client.post('/webhook-mercadopago', json={'type': 'payment', 'data': {'id': next(ctx.pagamentos)}})
+    processador_webhook.processar_pendentes()
+    return resposta
+
+
+CENARIOS = {
+    'vendas': _venda,
+    'financeiro': _financeiro,
+    'financeiro_frota': _financeiro_frota,
+    'caixa': _caixa,
+    'relatorio_vendas': _relatorio,
+    'reposicao': _reposicao,
+    'previsao': _previsao,
+    'webhook': _webhook,
+}
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return None
+    indice = max(0, min(len(valores_ordenados) - 1, round(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[indice]
+
+
+def medir(app, ctx, cenario, requisicoes, concorrencia, semente):
+    """Executa um cenário e devolve as estatísticas de latência (em ms) e vazão."""
+    funcao = CENARIOS[cenario]
+    latencias, status = [], {}
+    lock = threading.Lock()
+    fila = iter(range(requisicoes))
+
+    def trabalhar(indice):
+        client = app.test_client()
+        rnd = random.Random(semente + indice)
+        locais, codigos = [], {}
+        while True:
+            with lock:
+                if next(fila, None) is None:
+                    break
+            inicio = time.perf_counter()
+            resposta = funcao(client, ctx, rnd)
+            resposta.get_data()  # consome respostas em streaming
+            locais.append((time.perf_counter() - inicio) * 1000)
+            codigos[resposta.status_code] = codigos.get(resposta.status_code, 0) + 1
+        with lock:
+            latencias.extend(locais)
+            for codigo, n in codigos.items():
+                status[codigo] = status.get(codigo, 0) + n
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhar, args=(i,)) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'requisicoes': len(latencias),
+        'concorrencia': concorrencia,
+        'status': {str(k): v for k, v in sorted(status.items())},
+        'p50_ms': percentil(latencias, 50),
+        'p95_ms': percentil(latencias, 95),
+        'p99_ms': percentil(latencias, 99),
+        'media_ms': sum(latencias) / len(latencias) if latencias else None,
+        'vazao_rps': len(latencias) / duracao if duracao else None,
+    }
+
+
+def comparar(atual, anterior):
+    print(f"\n{'cenário':<20}{'p50 antes':>12}{'p50 agora':>12}{'p95 antes':>12}{'p95 agora':>12}{'vazão Δ':>10}")
+    for nome, dados in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome)
+        if not antes:
+            continue
+        delta = (dados['vazao_rps'] / antes['vazao_rps'] - 1) * 100 if antes['vazao_rps'] else 0
+        print(f"{nome:<20}{antes['p50_ms']:>12.2f}{dados['p50_ms']:>12.2f}"
+              f"{antes['p95_ms']:>12.2f}{dados['p95_ms']:>12.2f}{delta:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pasta', help='pasta com o smart_fridge.db gerado por gerar_dados.py')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS))
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--concorrencia', type=int, default=1)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='arquivo JSON para salvar o resultado')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    args = parser.parse_args()
+
+    # O app lê DB_PATH na importação
+    os.environ['DB_PATH'] = args.pasta
+    os.environ['WEBHOOK_WORKERS'] = '0'
+    sys.path.insert(0, RAIZ)
+    import app as modulo_app
+
+    db_file = os.path.join(args.pasta, 'smart_fridge.db')
+    ctx = Contexto(db_file)
+    modulo_app.processador_webhook.cliente_pagamentos = PagamentosFalsos(ctx.nomes)
+
+    resultado = {
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'banco': db_file,
+        'sqlite': sqlite3.sqlite_version,
+        'python': sys.version.split()[0],
+        'cenarios': {},
+    }
+    for cenario in args.cenarios.split(','):
+        dados = medir(modulo_app.app, ctx, cenario, args.requisicoes, args.concorrencia, args.semente)
+        resultado['cenarios'][cenario] = dados
+        print(f"{cenario:<20} p50={dados['p50_ms']:.2f}ms p95={dados['p95_ms']:.2f}ms "
+              f"p99={dados['p99_ms']:.2f}ms vazão={dados['vazao_rps']:.1f} req/s status={dados['status']}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(resultado, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Gera um banco SQLite sintético (e reprodutível) com o schema de database.py.
+
+O arquivo é sempre criado como <pasta>/smart_fridge.db, para poder ser usado
+pelo app com DB_PATH=<pasta>.
+
+Uso: python benchmarks/gerar_dados.py /tmp/bench --escala media [--vendas 2000000] [--semente 42]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import database  # noqa: E402
+
+ESCALAS = {
+    'pequena': {'condominios': 20, 'produtos': 200, 'itens_por_condominio': 40, 'vendas': 20_000, 'caixa': 5_000},
+    'media': {'condominios': 200, 'produtos': 2_000, 'itens_por_condominio': 80, 'vendas': 500_000, 'caixa': 100_000},
+    'grande': {'condominios': 500, 'produtos': 5_000, 'itens_por_condominio': 120, 'vendas': 3_000_000, 'caixa': 1_000_000},
+}
+LOTE = 50_000
+
+
+def nome_produto(i):
+    return f'Produto {i:05d}'
+
+
+def nome_condominio(i):
+    return f'Condominio {i:04d}'
+
+
+def _em_lotes(linhas):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _datas(total, dias, rnd):
+    # Datas crescentes (como na produção, ids maiores são vendas mais novas)
+    fim = datetime.datetime.now().replace(microsecond=0)
+    inicio = fim - datetime.timedelta(days=dias)
+    passo = (fim - inicio).total_seconds() / max(total, 1)
+    for i in range(total):
+        segundos = i * passo + rnd.random() * passo
+        yield (inicio + datetime.timedelta(seconds=segundos)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def gerar(pasta, condominios, produtos, itens_por_condominio, vendas, caixa, dias=365, semente=42):
+    """Cria <pasta>/smart_fridge.db e o preenche com dados sintéticos."""
+    os.makedirs(pasta, exist_ok=True)
+    db_file = os.path.join(pasta, 'smart_fridge.db')
+    if os.path.exists(db_file):
+        raise SystemExit(f"'{db_file}' já existe; use uma pasta vazia.")
+    database.criar_banco(db_file)
+
+    rnd = random.Random(semente)
+    conn = database.abrir_conexao(db_file)
+    conn.execute('PRAGMA synchronous = OFF')  # banco descartável: velocidade acima de durabilidade
+    inicio = time.perf_counter()
+
+    precos = []
+    for i in range(1, produtos + 1):
+        custo = round(rnd.uniform(0.5, 15), 2)
+        precos.append((custo, round(custo * rnd.uniform(1.2, 2.5), 2)))
+    conn.executemany(
+        'INSERT INTO produtos (id, nome, preco_custo, preco_venda) VALUES (?, ?, ?, ?)',
+        ((i, nome_produto(i), custo, venda) for i, (custo, venda) in enumerate(precos, start=1))
+    )
+    conn.executemany(
+        'INSERT INTO condominios (id, nome, responsavel, endereco, investimento, despesas_fixas) VALUES (?, ?, ?, ?, ?, ?)',
+        ((i, nome_condominio(i), f'Responsável {i}', f'Rua {rnd.randint(1, 999)}, {i}',
+          rnd.choice([5000, 8000, 12000]), 200.0) for i in range(1, condominios + 1))
+    )
+
+    itens = min(itens_por_condominio, produtos)
+    estoque = []
+    for condo_id in range(1, condominios + 1):
+        for produto_id in rnd.sample(range(1, produtos + 1), itens):
+            estoque.append((condo_id, produto_id, rnd.randint(0, 60), rnd.randint(3, 10)))
+    conn.executemany(
+        'INSERT INTO estoque (condominio_id, produto_id, quantidade, limite_critico) VALUES (?, ?, ?, ?)', estoque
+    )
+
+    def linhas_vendas():
+        for data in _datas(vendas, dias, rnd):
+            condo_id, produto_id = rnd.choice(estoque)[:2]
+            quantidade = rnd.randint(1, 3)
+            custo, venda = precos[produto_id - 1]
+            yield (condo_id, produto_id, quantidade, custo * quantidade, venda * quantidade, data)
+
+    for lote in _em_lotes(linhas_vendas()):
+        conn.executemany(
+            'INSERT INTO vendas (condominio_id, produto_id, quantidade, preco_custo_total, preco_venda_total, data_venda) '
+            'VALUES (?, ?, ?, ?, ?, ?)', lote
+        )
+
+    def linhas_caixa():
+        for data in _datas(caixa, dias, rnd):
+            if rnd.random() < 0.9:
+                yield ('entrada', round(rnd.uniform(1, 20), 2), 'Lucro da venda (sintético)', 'Sistema Automático', data)
+            else:
+                yield ('saida', round(rnd.uniform(10, 300), 2), 'Despesa (sintética)', 'Admin', data)
+
+    for lote in _em_lotes(linhas_caixa()):
+        conn.executemany(
+            'INSERT INTO caixa_transacoes (tipo, valor, descricao, responsavel, data_transacao) VALUES (?, ?, ?, ?, ?)',
+            lote
+        )
+
+    conn.commit()
+    conn.close()
+    database.otimizar_banco(db_file)
+    print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s: {condominios} condomínios, {produtos} produtos, "
+          f"{len(estoque)} itens de estoque, {vendas} vendas, {caixa} transações de caixa.")
+    return db_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pasta')
+    parser.add_argument('--escala', choices=ESCALAS, default='pequena')
+    for campo in ESCALAS['pequena']:
+        parser.add_argument(f"--{campo.replace('_', '-')}", dest=campo, type=int)
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    config = dict(ESCALAS[args.escala])
+    for campo in config:
+        if getattr(args, campo) is not None:
+            config[campo] = getattr(args, campo)
+    gerar(args.pasta, dias=args.dias, semente=args.semente, **config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compara a gravação de vendas com um commit por requisição x gravação em grupo.
+
+Roda executar.py (cenários de escrita, com várias threads) duas vezes sobre
+cópias idênticas do banco: uma com GRUPO_COMMIT=0 e outra com GRUPO_COMMIT=1.
+Use --synchronous FULL para simular um disco em que cada commit custa um fsync.
+
+Uso: python benchmarks/grupo_commit.py /tmp/bench [--requisicoes 2000] [--concorrencia 16] [--synchronous FULL]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def copiar_banco(origem, pasta):
+    destino = sqlite3.connect(os.path.join(pasta, 'smart_fridge.db'))
+    fonte = sqlite3.connect(origem)
+    fonte.backup(destino)
+    fonte.close()
+    destino.close()
+
+
+def rodar(pasta_origem, grupo, args):
+    with tempfile.TemporaryDirectory() as pasta:
+        copiar_banco(os.path.join(pasta_origem, 'smart_fridge.db'), pasta)
+        saida = os.path.join(pasta, 'resultado.json')
+        env = dict(os.environ, GRUPO_COMMIT='1' if grupo else '0', DB_SYNCHRONOUS=args.synchronous,
+                   METRICAS_ATIVAS='0')
+        if args.tamanho:
+            env['GRUPO_TAMANHO_MAX'] = str(args.tamanho)
+        if args.espera_ms is not None:
+            env['GRUPO_ESPERA_MS'] = str(args.espera_ms)
+        subprocess.run([
+            sys.executable, os.path.join(RAIZ, 'benchmarks', 'executar.py'), pasta,
+            '--cenarios', args.cenarios, '--requisicoes', str(args.requisicoes),
+            '--concorrencia', str(args.concorrencia), '--saida', saida,
+        ], env=env, check=True)
+        with open(saida, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pasta', help='pasta com o smart_fridge.db gerado por gerar_dados.py')
+    parser.add_argument('--cenarios', default='vendas,webhook')
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--concorrencia', type=int, default=16)
+    parser.add_argument('--synchronous', default=os.environ.get('DB_SYNCHRONOUS', 'NORMAL'))
+    parser.add_argument('--tamanho', type=int, help='GRUPO_TAMANHO_MAX')
+    parser.add_argument('--espera-ms', type=float, help='GRUPO_ESPERA_MS')
+    args = parser.parse_args()
+
+    print('--- um commit por requisição ---')
+    individual = rodar(args.pasta, False, args)
+    print('--- gravação em grupo ---')
+    grupo = rodar(args.pasta, True, args)
+
+    print(f"\nsynchronous={args.synchronous}, concorrência={args.concorrencia}")
+    print(f"{'cenário':<12}{'req/s antes':>14}{'req/s grupo':>14}{'ganho':>9}{'p95 antes':>12}{'p95 grupo':>12}")
+    for nome, antes in individual['cenarios'].items():
+        depois = grupo['cenarios'][nome]
+        ganho = (depois['vazao_rps'] / antes['vazao_rps'] - 1) * 100
+        print(f"{nome:<12}{antes['vazao_rps']:>14.1f}{depois['vazao_rps']:>14.1f}{ganho:>+8.1f}%"
+              f"{antes['p95_ms']:>12.2f}{depois['p95_ms']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compara a serialização das respostas: jsonify do Flask x respostas.resposta_json.
+
+Mede tempo por resposta e tamanho do corpo (sem compressão, gzip e brotli, se
+instalado) para consultas reais de um banco gerado por gerar_dados.py.
+
+Uso: python benchmarks/serializacao.py /tmp/bench [--repeticoes 20]
+"""
+import argparse
+import datetime
+import gzip
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from flask import Flask, jsonify  # noqa: E402
+
+import respostas  # noqa: E402
+
+CONSULTAS = {
+    'caixa (100 linhas)': 'SELECT * FROM caixa_transacoes ORDER BY id DESC LIMIT 100',
+    'produtos': 'SELECT * FROM produtos ORDER BY nome',
+    'relatorio_vendas (30 dias)': """
+        SELECT v.data_venda, c.nome as condominioNome, p.nome as produtoNome, v.quantidade,
+               v.preco_venda_total, v.preco_custo_total, (v.preco_venda_total - v.preco_custo_total) as lucro
+        FROM vendas v JOIN condominios c ON v.condominio_id = c.id JOIN produtos p ON v.produto_id = p.id
+        WHERE v.data_venda >= ? ORDER BY v.data_venda
+    """,
+}
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        corpo = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), corpo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pasta', help='pasta com o smart_fridge.db gerado por gerar_dados.py')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.path.join(args.pasta, 'smart_fridge.db'))
+    conn.row_factory = sqlite3.Row
+    ultima = conn.execute('SELECT MAX(data_venda) FROM vendas').fetchone()[0]
+    desde = (datetime.datetime.fromisoformat(ultima) - datetime.timedelta(days=30)).isoformat(' ')
+    app = Flask(__name__)
+
+    codificador = 'orjson' if respostas.orjson is not None else 'json (biblioteca padrão)'
+    print(f"Codificador: {codificador}; brotli: {'sim' if respostas.brotli is not None else 'não'}\n")
+    print(f"{'consulta':<28}{'linhas':>8}{'jsonify ms':>12}{'novo ms':>10}{'bytes':>11}{'gzip':>10}{'br':>10}")
+    for nome, sql in CONSULTAS.items():
+        linhas = conn.execute(sql, (desde,) if '?' in sql else ()).fetchall()
+        with app.test_request_context():
+            atual, _ = medir(lambda: jsonify([dict(l) for l in linhas]).get_data(), args.repeticoes)
+            novo, corpo = medir(lambda: respostas.resposta_json(linhas).get_data(), args.repeticoes)
+        comprimido = len(gzip.compress(corpo, compresslevel=respostas.COMPRESSAO_NIVEL_GZIP))
+        br = (len(respostas.brotli.compress(corpo, quality=respostas.COMPRESSAO_NIVEL_BROTLI))
+              if respostas.brotli is not None else '-')
+        print(f"{nome:<28}{len(linhas):>8}{atual:>12.2f}{novo:>10.2f}{len(corpo):>11}{comprimido:>10}{br:>10}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
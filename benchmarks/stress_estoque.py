@@ -0,0 +1,118 @@
+"""Teste de estresse: vendas concorrentes nunca deixam o estoque negativo.
+
+Vários processos (como os workers do gunicorn), cada um com várias threads,
+disputam o mesmo item de estoque via /api/vendas e /api/vendas/lote. No final,
+o estoque deve ser >= 0 e bater exatamente com o que foi vendido.
+
+Uso: python benchmarks/stress_estoque.py [--processos 4] [--threads 8] [--estoque 500]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(db_path, threads, tentativas, semente, resultados):
+    os.environ['DB_PATH'] = db_path
+    os.environ['WEBHOOK_WORKERS'] = '0'
+    sys.path.insert(0, RAIZ)
+    from app import app
+
+    vendidos, erros = [], []
+    lock = threading.Lock()
+
+    def vender(indice):
+        try:
+            _vender(indice)
+        except Exception as e:  # a exceção de uma thread não muda o código de saída sozinha
+            with lock:
+                erros.append(e)
+            raise
+
+    def _vender(indice):
+        client = app.test_client()
+        rnd = random.Random(semente * 1000 + indice)
+        total = 0
+        for n in range(tentativas):
+            quantidade = rnd.randint(1, 3)
+            if n % 5 == 0:
+                resposta = client.post('/api/vendas/lote', json={
+                    'chaveIdempotencia': f'{semente}-{indice}-{n}',
+                    'itens': [{'condominioId': 1, 'produtoId': 1, 'quantidade': quantidade}],
+                })
+            else:
+                resposta = client.post('/api/vendas', json={'condominioId': 1, 'produtoId': 1, 'quantidade': quantidade})
+            if resposta.status_code == 200:
+                total += quantidade
+            elif resposta.status_code != 400:
+                raise RuntimeError(f'Resposta inesperada: {resposta.status_code} {resposta.data!r}')
+        with lock:
+            vendidos.append(total)
+
+    pool = [threading.Thread(target=vender, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    resultados.put(sum(vendidos))
+    if erros:
+        print(f'{len(erros)} thread(s) falharam: {erros[0]!r}')
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--tentativas', type=int, default=50)
+    parser.add_argument('--estoque', type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = tempfile.mkdtemp(prefix='stress_estoque_')
+    sys.path.insert(0, RAIZ)
+    os.environ['DB_PATH'] = db_path
+    import database
+    database.criar_banco()
+
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.execute("INSERT INTO produtos (nome, preco_custo, preco_venda) VALUES ('Refrigerante', 2, 5)")
+    conn.execute("INSERT INTO condominios (nome, responsavel, endereco, investimento) VALUES ('Stress', 'x', 'x', 0)")
+    conn.execute('INSERT INTO estoque (condominio_id, produto_id, quantidade, limite_critico) VALUES (1, 1, ?, 5)', (args.estoque,))
+    conn.commit()
+
+    ctx = multiprocessing.get_context('spawn')
+    resultados = ctx.Queue()
+    processos = [
+        ctx.Process(target=_worker, args=(db_path, args.threads, args.tentativas, i, resultados))
+        for i in range(args.processos)
+    ]
+    for p in processos:
+        p.start()
+    vendido_clientes = sum(resultados.get() for _ in processos)
+    for p in processos:
+        p.join()
+    if any(p.exitcode for p in processos):
+        print('FALHA: um dos processos terminou com erro.')
+        return 1
+
+    restante = conn.execute('SELECT quantidade FROM estoque WHERE id = 1').fetchone()[0]
+    vendido_banco = conn.execute('SELECT IFNULL(SUM(quantidade), 0) FROM vendas').fetchone()[0]
+    conn.close()
+
+    print(f'Estoque inicial: {args.estoque} | restante: {restante} | '
+          f'vendido (clientes): {vendido_clientes} | vendido (banco): {vendido_banco}')
+    if restante < 0 or restante + vendido_banco != args.estoque or vendido_banco != vendido_clientes:
+        print('FALHA: o estoque ficou inconsistente.')
+        return 1
+    print('OK: o estoque nunca ficou negativo e bate com as vendas.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
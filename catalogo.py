@@ -0,0 +1,60 @@
+import json
+import threading
+
+# --- Cache em memória do catálogo (produtos e condomínios) ---
+# Os dados quase nunca mudam, então cada processo guarda as listas já
+# serializadas e os mapas nome -> linha. Triggers no banco incrementam
+# catalogo_versao.geracao a cada INSERT/UPDATE/DELETE nessas tabelas; comparar a
+# geração (uma leitura por chave primária) mantém todos os workers consistentes.
+
+
+def _serializar(linhas):
+    # Mesmo formato do jsonify do Flask: chaves ordenadas e sem espaços
+    return json.dumps([dict(l) for l in linhas], sort_keys=True, separators=(',', ':')).encode()
+
+
+class Catalogo:
+    """Retrato imutável do catálogo em uma determinada geração."""
+
+    def __init__(self, geracao, produtos, condominios):
+        self.geracao = geracao
+        self.produtos_json = _serializar(produtos)
+        self.condominios_json = _serializar(condominios)
+        self.etag_produtos = f'produtos-{geracao}'
+        self.etag_condominios = f'condominios-{geracao}'
+        # Em nomes repetidos vale o menor id, como no SELECT ... WHERE nome = ? original
+        self.produto_por_nome = {}
+        for p in sorted(produtos, key=lambda p: p['id']):
+            self.produto_por_nome.setdefault(p['nome'], p)
+        self.condominio_por_nome = {}
+        for c in sorted(condominios, key=lambda c: c['id']):
+            self.condominio_por_nome.setdefault(c['nome'], c)
+
+
+class CacheCatalogo:
+    """Cache de leitura do catálogo, recarregado quando a geração no banco muda."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalogo = None
+
+    def obter(self, conn):
+        geracao = conn.execute('SELECT geracao FROM catalogo_versao WHERE id = 1').fetchone()[0]
+        catalogo = self._catalogo
+        if catalogo is not None and catalogo.geracao == geracao:
+            return catalogo
+        with self._lock:
+            if self._catalogo is None or self._catalogo.geracao != geracao:
+                # A geração é lida antes dos dados: no pior caso o retrato fica
+                # mais novo que a geração e é recarregado na próxima consulta
+                produtos = [dict(p) for p in conn.execute('SELECT * FROM produtos ORDER BY nome')]
+                condominios = [dict(c) for c in conn.execute('SELECT * FROM condominios ORDER BY nome')]
+                self._catalogo = Catalogo(geracao, produtos, condominios)
+            return self._catalogo
+
+    def invalidar(self):
+        with self._lock:
+            self._catalogo = None
+
+
+cache_catalogo = CacheCatalogo()
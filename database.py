@@ -1,5 +1,11 @@
 import sqlite3
+import datetime
 import os
+import sys
+import queue
+import threading
+import time
+import urllib.parse
 
 # --- ALTERAÇÃO PARA RENDER ---
 # Define o caminho do banco de dados. No Render, ele usará um "Disco Persistente".
@@ -7,15 +13,194 @@ import os
 DB_PATH = os.environ.get("DB_PATH", ".") 
 DB_FILE = os.path.join(DB_PATH, "smart_fridge.db")
 
+# --- Ajustes de conexão (configuráveis por variáveis de ambiente) ---
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", "-16000"))  # negativo = KiB
+# Idade máxima (segundos) do snapshot usado pelas análises pesadas; 0 desativa o snapshot
+DB_SNAPSHOT_IDADE_MAX = int(os.environ.get("DB_SNAPSHOT_IDADE_MAX", "0"))
+# Dias de histórico mantidos no log de mudanças (clientes mais atrasados ressincronizam)
+MUDANCAS_RETENCAO_DIAS = int(os.environ.get("MUDANCAS_RETENCAO_DIAS", "7"))
+# Dias de eventos de estoque (SSE de reposição) mantidos; um cliente que volta
+# depois disso só recebe os eventos que ainda existem
+EVENTOS_RETENCAO_DIAS = int(os.environ.get("EVENTOS_RETENCAO_DIAS", "30"))
+
+# Vendas e transações de caixa mais antigas que isto vão para os arquivos mensais
+ARQUIVO_HORIZONTE_DIAS = int(os.environ.get("ARQUIVO_HORIZONTE_DIAS", "365"))
+
+
+def abrir_conexao(db_file=None, factory=sqlite3.Connection, somente_leitura=False):
+    """Abre uma conexão já com os PRAGMAs de desempenho aplicados.
+
+    `factory` permite usar uma subclasse de sqlite3.Connection (ex.: a versão
+    instrumentada de metricas.py). Com `somente_leitura`, o arquivo é aberto com
+    mode=ro e a conexão recusa qualquer escrita (PRAGMA query_only).
+    """
+    db_file = db_file or DB_FILE
+    if somente_leitura:
+        db_file = f"file:{urllib.parse.quote(os.path.abspath(db_file))}?mode=ro"
+    conn = sqlite3.connect(
+        db_file,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # o pool garante um único usuário por vez
+        factory=factory,
+        uri=somente_leitura,
+    )
+    conn.row_factory = sqlite3.Row
+    if somente_leitura:
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        # O modo de journal fica gravado no arquivo; só quem escreve precisa ajustá-lo
+        conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    return conn
+
+
+class PoolDeConexoes:
+    """Mantém até `tamanho` conexões abertas por processo (worker do gunicorn)."""
+
+    def __init__(self, db_file=None, tamanho=None, factory=sqlite3.Connection, somente_leitura=False):
+        self.db_file = db_file or DB_FILE
+        self.tamanho = tamanho or DB_POOL_SIZE
+        self.factory = factory
+        self.somente_leitura = somente_leitura
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # Conexões SQLite não podem atravessar um fork: cada processo tem as suas
+        self._pid = os.getpid()
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+
+    def obter(self):
+        """Pega uma conexão livre, abrindo uma nova se o pool ainda não estiver cheio."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reiniciar()
+            try:
+                return self._livres.get_nowait()
+            except queue.Empty:
+                if self._criadas < self.tamanho:
+                    self._criadas += 1
+                    return abrir_conexao(self.db_file, self.factory, self.somente_leitura)
+        # Pool esgotado: espera alguém devolver uma conexão
+        return self._livres.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+    def devolver(self, conn):
+        """Devolve a conexão ao pool, descartando transações não confirmadas."""
+        if self._pid != os.getpid():
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._livres.put(conn)
+
+    def fechar_todas(self):
+        with self._lock:
+            while True:
+                try:
+                    self._livres.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._criadas = 0
+
+
+class SnapshotDeLeitura:
+    """Cópia do banco, feita com a API de backup do SQLite, para as análises pesadas.
+
+    Tem a mesma interface do pool (obter/devolver). Se a cópia tiver mais de
+    `idade_max` segundos, a leitura vai para o pool `reserva` (o banco principal
+    em modo somente leitura) enquanto uma cópia nova é feita em segundo plano.
+    """
+
+    def __init__(self, db_file=None, idade_max=None, reserva=None, factory=sqlite3.Connection):
+        self.db_file = db_file or DB_FILE
+        self.arquivo = os.path.splitext(self.db_file)[0] + '.snapshot.db'
+        self.idade_max = idade_max or DB_SNAPSHOT_IDADE_MAX
+        self.reserva = reserva or PoolDeConexoes(self.db_file, factory=factory, somente_leitura=True)
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._atualizando = False
+        self._pool = None
+        self._versao = None
+        self._emprestadas = {}
+
+    def _pool_atual(self, versao):
+        # Cada cópia nova é um arquivo novo: as conexões antigas continuam lendo
+        # a cópia anterior até serem devolvidas e descartadas
+        with self._lock:
+            if self._versao != versao:
+                self._pool = PoolDeConexoes(self.arquivo, factory=self.factory, somente_leitura=True)
+                self._versao = versao
+            return self._pool
+
+    def obter(self):
+        try:
+            versao = os.path.getmtime(self.arquivo)
+        except FileNotFoundError:
+            versao = None
+        if versao is None or time.time() - versao > self.idade_max:
+            self.atualizar_em_segundo_plano()
+            pool = self.reserva
+        else:
+            pool = self._pool_atual(versao)
+        conn = pool.obter()
+        self._emprestadas[id(conn)] = pool
+        return conn
+
+    def devolver(self, conn):
+        self._emprestadas.pop(id(conn), self.reserva).devolver(conn)
+
+    def atualizar_em_segundo_plano(self):
+        with self._lock:
+            if self._atualizando:
+                return
+            self._atualizando = True
+        threading.Thread(target=self._atualizar, name='snapshot', daemon=True).start()
+
+    def _atualizar(self):
+        try:
+            self.atualizar()
+        except Exception as e:
+            print(f"ERRO ao atualizar o snapshot de leitura: {e}")
+        finally:
+            with self._lock:
+                self._atualizando = False
+
+    def atualizar(self):
+        """Copia o banco para um arquivo temporário e troca o snapshot de uma só vez."""
+        inicio = time.perf_counter()
+        temporario = f'{self.arquivo}.{os.getpid()}.tmp'
+        origem = sqlite3.connect(self.db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        destino = sqlite3.connect(temporario)
+        try:
+            # Cópia em um único passo: em WAL a transação de leitura não bloqueia
+            # os escritores, e uma cópia em etapas recomeçaria a cada venda gravada
+            origem.backup(destino)
+            destino.execute('PRAGMA journal_mode = DELETE')  # abre em mode=ro sem -wal/-shm
+        finally:
+            destino.close()
+            origem.close()
+        os.replace(temporario, self.arquivo)
+        print(f"Snapshot de leitura atualizado em {time.perf_counter() - inicio:.2f}s.")
+
 # Função para criar o banco de dados e as tabelas
-def criar_banco():
-    # Não cria um novo banco se ele já existir
-    if os.path.exists(DB_FILE):
-        print(f"O banco de dados '{DB_FILE}' já existe. Nenhuma ação foi tomada.")
+def criar_banco(db_file=None):
+    db_file = db_file or DB_FILE
+    # Não recria as tabelas se o banco já existir, mas aplica as migrações pendentes
+    if os.path.exists(db_file):
+        print(f"O banco de dados '{db_file}' já existe. Verificando migrações.")
+        aplicar_migracoes(db_file)
         return
 
-    print(f"Criando novo banco de dados em: {DB_FILE}")
-    conn = sqlite3.connect(DB_FILE)
+    print(f"Criando novo banco de dados em: {db_file}")
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
 
     # Tabela de Usuários
@@ -104,8 +289,607 @@ def criar_banco():
 
     conn.commit()
     conn.close()
-    print(f"Banco de dados '{DB_FILE}' criado com sucesso.")
+    print(f"Banco de dados '{db_file}' criado com sucesso.")
+    aplicar_migracoes(db_file)
+
+
+# --- MIGRAÇÕES ---
+# Cada migração recebe a conexão e deve ser idempotente. A versão aplicada fica
+# guardada em PRAGMA user_version. Nunca altere uma migração já publicada:
+# acrescente uma nova ao final da lista MIGRACOES.
+
+def _migracao_001_indices_vendas(conn):
+    """Índices de vendas por condomínio e por data."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vendas_condominio_data ON vendas (condominio_id, data_venda)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (data_venda)')
+
+def _migracao_002_indices_nomes(conn):
+    """Índices de busca por nome em produtos e condomínios."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_nome ON produtos (nome)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_condominios_nome ON condominios (nome)')
+
+def _migracao_003_indice_caixa_tipo(conn):
+    """Índice de cobertura para as somas do caixa por tipo."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_caixa_tipo_valor ON caixa_transacoes (tipo, valor)')
+
+def _reconstruir_totais(conn):
+    # Recalcula as tabelas de totais a partir do histórico completo de vendas
+    conn.execute('DELETE FROM totais_condominio')
+    conn.execute('DELETE FROM totais_condominio_produto')
+    conn.execute('''
+    INSERT INTO totais_condominio (condominio_id, faturamento, custo_total, unidades)
+    SELECT condominio_id, SUM(preco_venda_total), SUM(preco_custo_total), SUM(quantidade)
+    FROM vendas GROUP BY condominio_id
+    ''')
+    conn.execute('''
+    INSERT INTO totais_condominio_produto (condominio_id, produto_id, faturamento, custo_total, unidades)
+    SELECT condominio_id, produto_id, SUM(preco_venda_total), SUM(preco_custo_total), SUM(quantidade)
+    FROM vendas GROUP BY condominio_id, produto_id
+    ''')
+
+def _migracao_004_totais_financeiros(conn):
+    """Totais de vendas por condomínio (e por produto) mantidos por trigger."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS totais_condominio (
+        condominio_id INTEGER PRIMARY KEY,
+        faturamento REAL NOT NULL DEFAULT 0,
+        custo_total REAL NOT NULL DEFAULT 0,
+        unidades INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS totais_condominio_produto (
+        condominio_id INTEGER NOT NULL,
+        produto_id INTEGER NOT NULL,
+        faturamento REAL NOT NULL DEFAULT 0,
+        custo_total REAL NOT NULL DEFAULT 0,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (condominio_id, produto_id)
+    ) WITHOUT ROWID
+    ''')
+    # O trigger roda dentro da mesma transação de qualquer INSERT em vendas
+    # (registrar_venda, webhook do Mercado Pago, ...)
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_vendas_totais AFTER INSERT ON vendas
+    BEGIN
+        INSERT INTO totais_condominio (condominio_id, faturamento, custo_total, unidades)
+        VALUES (NEW.condominio_id, NEW.preco_venda_total, NEW.preco_custo_total, NEW.quantidade)
+        ON CONFLICT (condominio_id) DO UPDATE SET
+            faturamento = faturamento + excluded.faturamento,
+            custo_total = custo_total + excluded.custo_total,
+            unidades = unidades + excluded.unidades;
+        INSERT INTO totais_condominio_produto (condominio_id, produto_id, faturamento, custo_total, unidades)
+        VALUES (NEW.condominio_id, NEW.produto_id, NEW.preco_venda_total, NEW.preco_custo_total, NEW.quantidade)
+        ON CONFLICT (condominio_id, produto_id) DO UPDATE SET
+            faturamento = faturamento + excluded.faturamento,
+            custo_total = custo_total + excluded.custo_total,
+            unidades = unidades + excluded.unidades;
+    END
+    ''')
+    _reconstruir_totais(conn)
+
+def _coluna_existe(conn, tabela, coluna):
+    return any(c[1] == coluna for c in conn.execute(f'PRAGMA table_info({tabela})'))
+
+def _migracao_005_saldo_caixa(conn):
+    """Saldo acumulado por transação do caixa e índices para paginação."""
+    if not _coluna_existe(conn, 'caixa_transacoes', 'saldo_apos'):
+        conn.execute('ALTER TABLE caixa_transacoes ADD COLUMN saldo_apos REAL')
+    # Preenche o saldo das transações já existentes, em ordem de id
+    conn.execute('''
+    UPDATE caixa_transacoes SET saldo_apos = acumulado.saldo
+    FROM (
+        SELECT id, SUM(CASE tipo WHEN 'entrada' THEN valor WHEN 'saida' THEN -valor ELSE 0 END)
+                   OVER (ORDER BY id) AS saldo
+        FROM caixa_transacoes
+    ) AS acumulado
+    WHERE acumulado.id = caixa_transacoes.id
+    ''')
+    # Cada nova transação grava o saldo após ela, partindo do saldo da anterior
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_caixa_saldo AFTER INSERT ON caixa_transacoes
+    BEGIN
+        UPDATE caixa_transacoes SET saldo_apos =
+            IFNULL((SELECT saldo_apos FROM caixa_transacoes WHERE id < NEW.id ORDER BY id DESC LIMIT 1), 0)
+            + CASE NEW.tipo WHEN 'entrada' THEN NEW.valor WHEN 'saida' THEN -NEW.valor ELSE 0 END
+        WHERE id = NEW.id;
+    END
+    ''')
+    # As somas por tipo deixaram de existir; os filtros da listagem usam estes índices
+    conn.execute('DROP INDEX IF EXISTS idx_caixa_tipo_valor')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_caixa_tipo_id ON caixa_transacoes (tipo, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_caixa_data ON caixa_transacoes (data_transacao)')
+
+def _migracao_006_webhook_inbox(conn):
+    """Caixa de entrada das notificações do Mercado Pago."""
+    # status: pendente -> processando -> processado | ignorado | erro
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS webhook_inbox (
+        payment_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pendente',
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        erro TEXT,
+        recebido_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        proxima_tentativa TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_webhook_inbox_fila ON webhook_inbox (status, proxima_tentativa)')
+
+def _migracao_007_vendas_lote(conn):
+    """Chaves de idempotência das vendas em lote."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_lote (
+        chave TEXT PRIMARY KEY,
+        resposta TEXT NOT NULL,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _migracao_008_geracao_catalogo(conn):
+    """Contador de geração do catálogo, usado para invalidar os caches dos workers."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS catalogo_versao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        geracao INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalogo_versao (id, geracao) VALUES (1, 0)')
+    for tabela in ('produtos', 'condominios'):
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_{evento.lower()}_catalogo AFTER {evento} ON {tabela}
+            BEGIN
+                UPDATE catalogo_versao SET geracao = geracao + 1 WHERE id = 1;
+            END
+            ''')
+
+def _migracao_009_estoque_baixo(conn):
+    """Índice parcial de estoque baixo e eventos de cruzamento do limite crítico."""
+    # Só as linhas abaixo do limite entram no índice: a lista de reposição não
+    # precisa mais varrer todo o estoque
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_estoque_baixo ON estoque (condominio_id, produto_id)
+    WHERE quantidade <= limite_critico
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS eventos_estoque (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        estoque_id INTEGER NOT NULL,
+        tipo TEXT NOT NULL, -- 'baixo' ou 'reposto'
+        quantidade INTEGER NOT NULL,
+        limite_critico INTEGER NOT NULL,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    # Os triggers só gravam quando o item cruza o limite, em qualquer caminho
+    # de escrita (vendas, webhook, reposição, cadastro de estoque)
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_estoque_baixo_insert AFTER INSERT ON estoque
+    WHEN NEW.quantidade <= NEW.limite_critico
+    BEGIN
+        INSERT INTO eventos_estoque (estoque_id, tipo, quantidade, limite_critico)
+        VALUES (NEW.id, 'baixo', NEW.quantidade, NEW.limite_critico);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_estoque_baixo_update AFTER UPDATE OF quantidade, limite_critico ON estoque
+    WHEN (OLD.quantidade <= OLD.limite_critico) != (NEW.quantidade <= NEW.limite_critico)
+    BEGIN
+        INSERT INTO eventos_estoque (estoque_id, tipo, quantidade, limite_critico)
+        VALUES (
+            NEW.id,
+            CASE WHEN NEW.quantidade <= NEW.limite_critico THEN 'baixo' ELSE 'reposto' END,
+            NEW.quantidade, NEW.limite_critico
+        );
+    END
+    ''')
+
+def _reconstruir_vendas_diarias(conn, desde=None):
+    # Com `desde`, os dias anteriores (já arquivados) são preservados
+    desde = desde or '0000-00-00'
+    conn.execute('DELETE FROM vendas_diarias WHERE dia >= ?', (desde,))
+    conn.execute('''
+    INSERT INTO vendas_diarias (dia, condominio_id, produto_id, unidades, faturamento, custo_total, lucro)
+    SELECT date(data_venda), condominio_id, produto_id, SUM(quantidade),
+           SUM(preco_venda_total), SUM(preco_custo_total), SUM(preco_venda_total - preco_custo_total)
+    FROM vendas WHERE data_venda >= ? GROUP BY date(data_venda), condominio_id, produto_id
+    ''', (desde,))
+
+def _migracao_010_vendas_diarias(conn):
+    """Resumo diário de vendas por condomínio e produto, mantido por trigger."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vendas_diarias (
+        dia TEXT NOT NULL,
+        condominio_id INTEGER NOT NULL,
+        produto_id INTEGER NOT NULL,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        faturamento REAL NOT NULL DEFAULT 0,
+        custo_total REAL NOT NULL DEFAULT 0,
+        lucro REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, condominio_id, produto_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_vendas_diarias AFTER INSERT ON vendas
+    BEGIN
+        INSERT INTO vendas_diarias (dia, condominio_id, produto_id, unidades, faturamento, custo_total, lucro)
+        VALUES (date(NEW.data_venda), NEW.condominio_id, NEW.produto_id, NEW.quantidade,
+                NEW.preco_venda_total, NEW.preco_custo_total, NEW.preco_venda_total - NEW.preco_custo_total)
+        ON CONFLICT (dia, condominio_id, produto_id) DO UPDATE SET
+            unidades = unidades + excluded.unidades,
+            faturamento = faturamento + excluded.faturamento,
+            custo_total = custo_total + excluded.custo_total,
+            lucro = lucro + excluded.lucro;
+    END
+    ''')
+    _reconstruir_vendas_diarias(conn)
+
+def _migracao_011_arquivamento(conn):
+    """Estado do arquivamento mensal e totais das vendas arquivadas."""
+    # arquivado_ate: tudo antes desta data (AAAA-MM-DD) foi para os arquivos mensais.
+    # saldo_caixa: saldo_apos da última transação de caixa arquivada.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS arquivamento (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        arquivado_ate TEXT,
+        caixa_ultimo_id INTEGER NOT NULL DEFAULT 0,
+        saldo_caixa REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO arquivamento (id) VALUES (1)')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS totais_arquivados (
+        condominio_id INTEGER NOT NULL,
+        produto_id INTEGER NOT NULL,
+        faturamento REAL NOT NULL DEFAULT 0,
+        custo_total REAL NOT NULL DEFAULT 0,
+        unidades INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (condominio_id, produto_id)
+    ) WITHOUT ROWID
+    ''')
+    # Se todo o caixa for arquivado, a próxima transação parte do saldo arquivado
+    conn.execute('DROP TRIGGER IF EXISTS trg_caixa_saldo')
+    conn.execute('''
+    CREATE TRIGGER trg_caixa_saldo AFTER INSERT ON caixa_transacoes
+    BEGIN
+        UPDATE caixa_transacoes SET saldo_apos =
+            COALESCE(
+                (SELECT saldo_apos FROM caixa_transacoes WHERE id < NEW.id ORDER BY id DESC LIMIT 1),
+                (SELECT saldo_caixa FROM arquivamento WHERE id = 1),
+                0
+            )
+            + CASE NEW.tipo WHEN 'entrada' THEN NEW.valor WHEN 'saida' THEN -NEW.valor ELSE 0 END
+        WHERE id = NEW.id;
+    END
+    ''')
+
+def _migracao_012_indices_nome_nocase(conn):
+    """Índices NOCASE para a busca por prefixo de nome (LIKE 'abc%')."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_produtos_nome_nocase ON produtos (nome COLLATE NOCASE)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_condominios_nome_nocase ON condominios (nome COLLATE NOCASE)')
+
+def _migracao_013_mudancas(conn):
+    """Log de mudanças (append-only) para a sincronização incremental dos clientes."""
+    # Só a chave do registro: os dados atuais são lidos na hora de responder.
+    # condominio_id permite que o tablet de um condomínio filtre o que é dele.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS mudancas (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tabela TEXT NOT NULL,
+        registro_id INTEGER NOT NULL,
+        condominio_id INTEGER,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    # Os triggers rodam na mesma transação de qualquer escrita (rotas, webhook,
+    # importações). O caixa é um livro-razão: só inserções entram no log, e o
+    # arquivamento de transações antigas não vira uma avalanche de remoções.
+    eventos = {
+        'produtos': (('INSERT', 'NEW', 'NULL'), ('UPDATE', 'NEW', 'NULL'), ('DELETE', 'OLD', 'NULL')),
+        'condominios': (('INSERT', 'NEW', 'NEW.id'), ('UPDATE', 'NEW', 'NEW.id'), ('DELETE', 'OLD', 'OLD.id')),
+        'estoque': (('INSERT', 'NEW', 'NEW.condominio_id'), ('UPDATE', 'NEW', 'NEW.condominio_id'),
+                    ('DELETE', 'OLD', 'OLD.condominio_id')),
+        'caixa_transacoes': (('INSERT', 'NEW', 'NULL'),),
+    }
+    for tabela, gatilhos in eventos.items():
+        for evento, linha, condominio in gatilhos:
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_{evento.lower()}_mudancas AFTER {evento} ON {tabela}
+            BEGIN
+                INSERT INTO mudancas (tabela, registro_id, condominio_id) VALUES ('{tabela}', {linha}.id, {condominio});
+            END
+            ''')
+
+def _migracao_014_geracao_estoque(conn):
+    """Contador de geração do estoque, usado para invalidar a previsão em todos os workers."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS estoque_versao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        geracao INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO estoque_versao (id, geracao) VALUES (1, 0)')
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_estoque_{evento.lower()}_versao AFTER {evento} ON estoque
+        BEGIN
+            UPDATE estoque_versao SET geracao = geracao + 1 WHERE id = 1;
+        END
+        ''')
+
+def _migracao_015_chave_sessao(conn):
+    """Chave de assinatura dos tokens de sessão, compartilhada por todos os workers."""
+    # Gerada uma única vez (a migração roda sob BEGIN IMMEDIATE): todos os
+    # workers assinam com a mesma chave e os tokens sobrevivem a um reinício.
+    # A variável de ambiente SECRET_KEY, se definida, tem prioridade.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS configuracao (
+        chave TEXT PRIMARY KEY,
+        valor TEXT NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO configuracao (chave, valor) VALUES ('secret_key', lower(hex(randomblob(32))))")
+
+MIGRACOES = [
+    _migracao_001_indices_vendas,
+    _migracao_002_indices_nomes,
+    _migracao_003_indice_caixa_tipo,
+    _migracao_004_totais_financeiros,
+    _migracao_005_saldo_caixa,
+    _migracao_006_webhook_inbox,
+    _migracao_007_vendas_lote,
+    _migracao_008_geracao_catalogo,
+    _migracao_009_estoque_baixo,
+    _migracao_010_vendas_diarias,
+    _migracao_011_arquivamento,
+    _migracao_012_indices_nome_nocase,
+    _migracao_013_mudancas,
+    _migracao_014_geracao_estoque,
+    _migracao_015_chave_sessao,
+]
+
+def aplicar_migracoes(db_file=None):
+    """Aplica, em ordem, as migrações com número maior que o PRAGMA user_version."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.isolation_level = None  # controlamos as transações manualmente
+    try:
+        for numero, migracao in enumerate(MIGRACOES, start=1):
+            # BEGIN IMMEDIATE impede que dois workers apliquem a mesma migração
+            conn.execute('BEGIN IMMEDIATE')
+            versao_atual = conn.execute('PRAGMA user_version').fetchone()[0]
+            if numero <= versao_atual:
+                conn.execute('COMMIT')
+                continue
+            try:
+                migracao(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            print(f"Migração {numero} aplicada: {migracao.__doc__}")
+    finally:
+        conn.close()
+
+def ler_configuracao(chave, db_file=None):
+    """Valor gravado na tabela configuracao, ou None."""
+    conn = sqlite3.connect(db_file or DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    try:
+        linha = conn.execute('SELECT valor FROM configuracao WHERE chave = ?', (chave,)).fetchone()
+    finally:
+        conn.close()
+    return linha[0] if linha else None
+
+def otimizar_banco(db_file=None):
+    """Atualiza as estatísticas do planejador de consultas (ANALYZE + PRAGMA optimize)."""
+    db_file = db_file or DB_FILE
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    try:
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Banco de dados '{db_file}' otimizado.")
+
+def reconstruir_totais(db_file=None):
+    """Recalcula do zero os totais financeiros e o resumo diário a partir da tabela de vendas."""
+    db_file = db_file or DB_FILE
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        _reconstruir_totais(conn)
+        _somar_totais_arquivados(conn)
+        arquivado_ate = conn.execute('SELECT arquivado_ate FROM arquivamento WHERE id = 1').fetchone()[0]
+        _reconstruir_vendas_diarias(conn, desde=arquivado_ate)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    print(f"Totais financeiros de '{db_file}' reconstruídos.")
+
+def podar_mudancas(db_file=None, dias=None):
+    """Apaga do log de mudanças as entradas mais antigas que MUDANCAS_RETENCAO_DIAS."""
+    db_file = db_file or DB_FILE
+    dias = MUDANCAS_RETENCAO_DIAS if dias is None else dias
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    try:
+        apagadas = conn.execute(
+            "DELETE FROM mudancas WHERE criado_em < datetime('now', ?)", (f'-{dias} days',)
+        ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Log de mudanças podado: {apagadas} entradas com mais de {dias} dias removidas.")
+
+def podar_eventos_estoque(db_file=None, dias=None):
+    """Apaga os eventos de estoque mais antigos que EVENTOS_RETENCAO_DIAS."""
+    db_file = db_file or DB_FILE
+    dias = EVENTOS_RETENCAO_DIAS if dias is None else dias
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    try:
+        apagados = conn.execute(
+            "DELETE FROM eventos_estoque WHERE criado_em < datetime('now', ?)", (f'-{dias} days',)
+        ).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Eventos de estoque podados: {apagados} eventos com mais de {dias} dias removidos.")
+
+
+# --- Arquivamento mensal ---
+# Vendas e transações de caixa anteriores ao horizonte saem do banco principal
+# para um arquivo SQLite por mês (arquivo_AAAA-MM.db, na mesma pasta). Os totais
+# financeiros e o resumo diário não mudam: os triggers só somam, e os totais das
+# vendas arquivadas ficam em totais_arquivados para o reconstruir-totais.
+
+def caminho_arquivo(mes, db_file=None):
+    """Arquivo frio de um mês (AAAA-MM), ao lado do banco principal."""
+    return os.path.join(os.path.dirname(db_file or DB_FILE) or '.', f'arquivo_{mes}.db')
+
+def meses_arquivados(inicio=None, fim=None, db_file=None):
+    """Meses (AAAA-MM) com arquivo em disco dentro de [inicio, fim], em ordem."""
+    pasta = os.path.dirname(db_file or DB_FILE) or '.'
+    meses = sorted(
+        nome[len('arquivo_'):-len('.db')] for nome in os.listdir(pasta)
+        if nome.startswith('arquivo_') and nome.endswith('.db')
+    )
+    return [m for m in meses if (not inicio or m >= inicio[:7]) and (not fim or m <= fim[:7])]
+
+def fontes_vendas(conn, inicio=None, fim=None, db_file=None):
+    """Tabelas de vendas que cobrem [inicio, fim], em ordem cronológica.
+
+    Cada arquivo mensal fica anexado (ATTACH) só enquanto o chamador consome a
+    sua tabela, então o limite de bancos anexados do SQLite não é problema.
+    """
+    for mes in meses_arquivados(inicio, fim, db_file):
+        conn.execute('ATTACH DATABASE ? AS arquivo', (caminho_arquivo(mes, db_file),))
+        try:
+            yield 'arquivo.vendas'
+        finally:
+            conn.execute('DETACH DATABASE arquivo')
+    yield 'main.vendas'
+
+def _somar_totais_arquivados(conn):
+    conn.execute('''
+    INSERT INTO totais_condominio (condominio_id, faturamento, custo_total, unidades)
+    SELECT condominio_id, SUM(faturamento), SUM(custo_total), SUM(unidades)
+    FROM totais_arquivados WHERE true GROUP BY condominio_id
+    ON CONFLICT (condominio_id) DO UPDATE SET
+        faturamento = faturamento + excluded.faturamento,
+        custo_total = custo_total + excluded.custo_total,
+        unidades = unidades + excluded.unidades
+    ''')
+    conn.execute('''
+    INSERT INTO totais_condominio_produto (condominio_id, produto_id, faturamento, custo_total, unidades)
+    SELECT condominio_id, produto_id, faturamento, custo_total, unidades FROM totais_arquivados WHERE true
+    ON CONFLICT (condominio_id, produto_id) DO UPDATE SET
+        faturamento = faturamento + excluded.faturamento,
+        custo_total = custo_total + excluded.custo_total,
+        unidades = unidades + excluded.unidades
+    ''')
+
+def _criar_tabelas_arquivo(conn):
+    # Mesmo schema das tabelas do banco principal, sem os triggers
+    for tabela, coluna_data in (('vendas', 'data_venda'), ('caixa_transacoes', 'data_transacao')):
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (tabela,)).fetchone()[0]
+        conn.execute(sql.replace(f'CREATE TABLE {tabela}', f'CREATE TABLE IF NOT EXISTS arquivo.{tabela}', 1))
+        conn.execute(f'CREATE INDEX IF NOT EXISTS arquivo.idx_{tabela}_data ON {tabela} ({coluna_data})')
+
+def _proximo_mes(mes):
+    ano, numero = map(int, mes.split('-'))
+    return f'{ano + numero // 12:04d}-{numero % 12 + 1:02d}-01'
+
+def _arquivar_mes(conn, mes):
+    inicio, fim = f'{mes}-01', _proximo_mes(mes)
+    vendas = 'main.vendas WHERE data_venda >= ? AND data_venda < ?'
+    caixa = 'main.caixa_transacoes WHERE data_transacao >= ? AND data_transacao < ?'
+
+    # 1) Copia para o arquivo. INSERT OR IGNORE torna a cópia repetível se o
+    #    job for interrompido entre os dois passos.
+    conn.execute('BEGIN IMMEDIATE')
+    _criar_tabelas_arquivo(conn)
+    conn.execute(f'INSERT OR IGNORE INTO arquivo.vendas SELECT * FROM {vendas}', (inicio, fim))
+    conn.execute(f'INSERT OR IGNORE INTO arquivo.caixa_transacoes SELECT * FROM {caixa}', (inicio, fim))
+    conn.execute('COMMIT')
+
+    # 2) Só depois da cópia confirmada remove do banco principal (apenas o que
+    #    está no arquivo), guardando os totais e o saldo do caixa
+    vendas += ' AND id IN (SELECT id FROM arquivo.vendas)'
+    caixa += ' AND id IN (SELECT id FROM arquivo.caixa_transacoes)'
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute(f'''
+    INSERT INTO totais_arquivados (condominio_id, produto_id, faturamento, custo_total, unidades)
+    SELECT condominio_id, produto_id, SUM(preco_venda_total), SUM(preco_custo_total), SUM(quantidade)
+    FROM {vendas} GROUP BY condominio_id, produto_id
+    ON CONFLICT (condominio_id, produto_id) DO UPDATE SET
+        faturamento = faturamento + excluded.faturamento,
+        custo_total = custo_total + excluded.custo_total,
+        unidades = unidades + excluded.unidades
+    ''', (inicio, fim))
+    conn.execute(f'''
+    UPDATE arquivamento SET caixa_ultimo_id = ultima.id, saldo_caixa = ultima.saldo_apos
+    FROM (SELECT id, saldo_apos FROM {caixa} ORDER BY id DESC LIMIT 1) AS ultima
+    WHERE arquivamento.id = 1 AND ultima.id > arquivamento.caixa_ultimo_id
+    ''', (inicio, fim))
+    removidas = conn.execute(f'DELETE FROM {vendas}', (inicio, fim)).rowcount
+    removidas_caixa = conn.execute(f'DELETE FROM {caixa}', (inicio, fim)).rowcount
+    conn.execute(
+        'UPDATE arquivamento SET arquivado_ate = ? WHERE id = 1 AND (arquivado_ate IS NULL OR arquivado_ate < ?)',
+        (fim, fim)
+    )
+    conn.execute('COMMIT')
+    return removidas, removidas_caixa
+
+def arquivar(db_file=None, horizonte_dias=None):
+    """Move vendas e transações de caixa de meses fechados anteriores ao horizonte para os arquivos mensais."""
+    db_file = db_file or DB_FILE
+    horizonte = ARQUIVO_HORIZONTE_DIAS if horizonte_dias is None else horizonte_dias
+    # Só meses inteiros: o corte é o primeiro dia do mês que contém o horizonte
+    corte = (datetime.date.today() - datetime.timedelta(days=horizonte)).replace(day=1).isoformat()
+
+    conn = sqlite3.connect(db_file, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.isolation_level = None
+    try:
+        meses = [linha[0] for linha in conn.execute('''
+            SELECT strftime('%Y-%m', data_venda) FROM vendas WHERE data_venda < ?
+            UNION
+            SELECT strftime('%Y-%m', data_transacao) FROM caixa_transacoes WHERE data_transacao < ?
+            ORDER BY 1
+        ''', (corte, corte))]
+        for mes in meses:
+            conn.execute('ATTACH DATABASE ? AS arquivo', (caminho_arquivo(mes, db_file),))
+            try:
+                vendas, caixa = _arquivar_mes(conn, mes)
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            finally:
+                conn.execute('DETACH DATABASE arquivo')
+            print(f"Mês {mes} arquivado: {vendas} vendas e {caixa} transações de caixa.")
+    finally:
+        conn.close()
+    print(f"Arquivamento concluído: dados anteriores a {corte} estão em arquivos mensais.")
+
+
+# Comandos disponíveis ao executar este arquivo pelo terminal
+COMANDOS = {
+    'criar': criar_banco,
+    'migrar': aplicar_migracoes,
+    'otimizar': otimizar_banco,
+    'reconstruir-totais': reconstruir_totais,
+    'arquivar': arquivar,
+    'podar-mudancas': podar_mudancas,
+    'podar-eventos': podar_eventos_estoque,
+}
 
 # Permite que este script seja executado diretamente pelo terminal
+# Uso: python database.py [criar|migrar|otimizar|reconstruir-totais|arquivar|podar-mudancas|podar-eventos]
 if __name__ == "__main__":
-    criar_banco()
+    comando = sys.argv[1] if len(sys.argv) > 1 else 'criar'
+    if comando not in COMANDOS:
+        print(f"Comando desconhecido: {comando}. Use um de: {', '.join(COMANDOS)}")
+        sys.exit(1)
+    COMANDOS[comando]()
@@ -0,0 +1,100 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as TempoEsgotado
+
+from database import DB_BUSY_TIMEOUT_MS, abrir_conexao
+
+# --- Gravação em grupo (group commit) ---
+# Com GRUPO_COMMIT=1, as vendas não fazem cada uma o seu commit: uma thread
+# gravadora por processo recebe os comandos por uma fila e os aplica em
+# micro-lotes (até GRUPO_TAMANHO_MAX comandos, esperando no máximo
+# GRUPO_ESPERA_MS pelo lote encher), com um único BEGIN IMMEDIATE/COMMIT por
+# lote. Cada comando roda em um SAVEPOINT próprio: a falha de um não desfaz os
+# outros, e cada chamador recebe o seu próprio resultado.
+
+GRUPO_COMMIT = os.environ.get("GRUPO_COMMIT", "0") == "1"
+GRUPO_TAMANHO_MAX = int(os.environ.get("GRUPO_TAMANHO_MAX", "64"))
+GRUPO_ESPERA_MS = float(os.environ.get("GRUPO_ESPERA_MS", "2"))
+
+
+class GravadorEmGrupo:
+    """Executa funções `funcao(conn, *args)` em lote, na thread gravadora do processo."""
+
+    def __init__(self, db_file=None, tamanho_max=None, espera_ms=None, factory=sqlite3.Connection):
+        self.db_file = db_file
+        self.tamanho_max = tamanho_max or GRUPO_TAMANHO_MAX
+        self.espera = (GRUPO_ESPERA_MS if espera_ms is None else espera_ms) / 1000
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _garantir(self):
+        # Threads não sobrevivem a um fork: cada worker sobe a sua gravadora
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._fila = queue.Queue()
+                threading.Thread(target=self._loop, args=(self._fila,), name='gravador', daemon=True).start()
+
+    def executar(self, funcao, *args):
+        """Enfileira o comando e espera o commit do lote. Devolve o retorno de `funcao`
+        ou levanta a exceção que ela (ou o commit) levantou."""
+        self._garantir()
+        futuro = Future()
+        self._fila.put((funcao, args, futuro))
+        try:
+            return futuro.result(timeout=DB_BUSY_TIMEOUT_MS / 1000 * 4)
+        except TempoEsgotado:
+            # Cancela para a gravadora não aplicar depois um comando que o
+            # chamador já deu como falho (um novo envio venderia duas vezes).
+            # Se o lote dele já começou, espera o resultado: ele vai terminar.
+            if futuro.cancel():
+                raise
+            return futuro.result()
+
+    def _loop(self, fila):
+        conn = abrir_conexao(self.db_file, self.factory)
+        while True:
+            lote = [fila.get()]
+            prazo = time.monotonic() + self.espera
+            while len(lote) < self.tamanho_max:
+                restante = prazo - time.monotonic()
+                try:
+                    lote.append(fila.get(timeout=restante) if restante > 0 else fila.get_nowait())
+                except queue.Empty:
+                    break
+            self._aplicar(conn, lote)
+
+    def _aplicar(self, conn, lote):
+        # Descarta os comandos cancelados por tempo esgotado; os demais passam
+        # a RUNNING e não podem mais ser cancelados
+        lote = [comando for comando in lote if comando[2].set_running_or_notify_cancel()]
+        if not lote:
+            return
+        resultados = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for funcao, args, futuro in lote:
+                conn.execute('SAVEPOINT comando')
+                try:
+                    resultados.append((futuro, funcao(conn, *args), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO comando')
+                    resultados.append((futuro, None, e))
+                conn.execute('RELEASE comando')
+            conn.commit()  # um único commit (e fsync) para o lote inteiro
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"ERRO no lote de gravação ({len(lote)} comandos): {e}")
+            for _, _, futuro in lote:
+                futuro.set_exception(e)
+            return
+        for futuro, resultado, erro in resultados:
+            if erro is not None:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(resultado)
@@ -0,0 +1,21 @@
+import os
+import sys
+
+# --- Configuração do gunicorn (lida automaticamente por `gunicorn app:app` nesta pasta) ---
+# O SSE de reposição (/api/reposicao/stream) e o long-poll de /api/mudancas
+# mantêm a requisição aberta. Com o worker sync padrão, cada cliente conectado
+# prenderia um worker inteiro; com gthread ele ocupa só uma thread.
+
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = 'gthread'
+# Conexões abertas ao mesmo tempo por worker (streams SSE + long-polls + requisições comuns)
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+
+def worker_exit(server, worker):
+    # Fecha as conexões SQLite dos pools ao sair do worker; a última conexão a
+    # fechar faz o checkpoint do WAL
+    app = sys.modules.get('app')
+    if app is not None:
+        app.pool_conexoes.fechar_todas()
+        app.pool_leitura.fechar_todas()
@@ -0,0 +1,104 @@
+import csv
+import io
+import math
+
+# --- Leitura e validação das importações em massa (CSV ou JSON) ---
+# Todas as linhas são validadas antes de qualquer escrita; o relatório de erros
+# aponta o número da linha (1 = primeira linha de dados) e o problema.
+
+# Aceita tanto os nomes da API (camelCase) quanto os das colunas do banco,
+# para que um arquivo exportado possa ser importado de volta sem edição
+SINONIMOS = {
+    'precoCusto': 'preco_custo',
+    'precoVenda': 'preco_venda',
+    'condominioId': 'condominio_id',
+    'produtoId': 'produto_id',
+    'limiteCritico': 'limite_critico',
+}
+
+# campo -> (conversor, obrigatório, valor mínimo)
+CAMPOS_PRODUTO = {
+    'id': (int, False, 1),
+    'nome': (str, True, None),
+    'preco_custo': (float, True, 0),
+    'preco_venda': (float, True, 0),
+}
+CAMPOS_ESTOQUE = {
+    'condominio_id': (int, True, 1),
+    'produto_id': (int, True, 1),
+    'quantidade': (int, True, 0),
+    'limite_critico': (int, True, 0),
+}
+
+
+class ImportacaoInvalida(Exception):
+    """O corpo da requisição não é um CSV nem uma lista JSON."""
+
+
+def ler_linhas(request):
+    """Lê o corpo como CSV (Content-Type text/csv) ou lista JSON (ou {"itens": [...]})."""
+    if request.mimetype == 'text/csv':
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    dados = request.get_json(silent=True)
+    if isinstance(dados, dict):
+        dados = dados.get('itens')
+    if not isinstance(dados, list) or not all(isinstance(linha, dict) for linha in dados):
+        raise ImportacaoInvalida('Envie um CSV (text/csv) ou uma lista JSON de objetos.')
+    return dados
+
+
+def _converter(conversor, valor):
+    """Converte sem arredondar nem aceitar tipos por acaso; ValueError se não der."""
+    # bool é subclasse de int: True viraria o id 1
+    if isinstance(valor, bool):
+        raise ValueError
+    if conversor is str:
+        if not isinstance(valor, str):
+            raise ValueError
+        return valor
+    if conversor is int:
+        # 2.9 não pode virar 2 em silêncio; 2.0 (JSON) é aceito
+        if isinstance(valor, float):
+            if not math.isfinite(valor) or not valor.is_integer():
+                raise ValueError
+            return int(valor)
+        if not isinstance(valor, (int, str)):
+            raise ValueError
+        return int(valor)
+    if not isinstance(valor, (int, float, str)):
+        raise ValueError
+    valor = conversor(valor)
+    # NaN viraria NULL no SQLite, e 'inf' passaria pelo valor mínimo
+    if not math.isfinite(valor):
+        raise ValueError
+    return valor
+
+
+def validar_linhas(linhas, campos):
+    """Converte e valida cada linha. Devolve ([(número da linha, registro)], erros por linha)."""
+    registros, erros = [], []
+    for numero, linha in enumerate(linhas, start=1):
+        linha = {SINONIMOS.get(chave, chave): valor for chave, valor in linha.items()}
+        registro = {}
+        try:
+            for campo, (conversor, obrigatorio, minimo) in campos.items():
+                valor = linha.get(campo)
+                if isinstance(valor, str):
+                    valor = valor.strip()
+                if valor is None or valor == '':
+                    if obrigatorio:
+                        raise ValueError(f"campo '{campo}' é obrigatório")
+                    registro[campo] = None
+                    continue
+                try:
+                    valor = _converter(conversor, valor)
+                except (TypeError, ValueError, OverflowError):
+                    raise ValueError(f"valor inválido para '{campo}': {valor!r}")
+                if minimo is not None and valor < minimo:
+                    raise ValueError(f"'{campo}' deve ser maior ou igual a {minimo}")
+                registro[campo] = valor
+        except ValueError as e:
+            erros.append({'linha': numero, 'erro': str(e)})
+            continue
+        registros.append((numero, registro))
+    return registros, erros
@@ -0,0 +1,205 @@
+import bisect
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Métricas de latência no formato texto do Prometheus ---
+# Histogramas em memória, por processo: cada worker do gunicorn expõe os seus
+# próprios números em /metrics. Cada observação custa um bisect e um lock.
+
+METRICAS_ATIVAS = os.environ.get("METRICAS_ATIVAS", "1") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "250"))
+MAX_CONSULTAS = 300  # limite de rótulos de consulta distintos, para não explodir as séries
+MAX_CACHE_SQL = 2000  # textos SQL brutos guardados com o rótulo já calculado
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, segundos):
+        self.contagens[bisect.bisect_left(BUCKETS, segundos)] += 1
+        self.soma += segundos
+        self.total += 1
+
+
+class Familia:
+    """Um histograma por combinação de rótulos."""
+
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valores, segundos):
+        with self._lock:
+            serie = self.series.get(valores)
+            if serie is None:
+                serie = self.series[valores] = Histograma()
+            serie.observar(segundos)
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            series = [(v, list(h.contagens), h.soma, h.total) for v, h in self.series.items()]
+        for valores, contagens, soma, total in series:
+            rotulos = ','.join(f'{r}="{_escapar(v)}"' for r, v in zip(self.rotulos, valores))
+            acumulado = 0
+            for limite, n in zip(BUCKETS, contagens):
+                acumulado += n
+                linhas.append(f'{self.nome}_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{{{rotulos},le="+Inf"}} {total}')
+            linhas.append(f'{self.nome}_sum{{{rotulos}}} {soma}')
+            linhas.append(f'{self.nome}_count{{{rotulos}}} {total}')
+        return linhas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+requisicoes = Familia('http_request_duration_seconds', 'Latência das rotas HTTP.', ('rota', 'metodo', 'status'))
+consultas = Familia('sqlite_query_duration_seconds', 'Tempo de execução das consultas SQL.', ('consulta',))
+leituras = Familia('sqlite_fetch_duration_seconds', 'Tempo de leitura das linhas das consultas SQL.', ('consulta',))
+operacoes = Familia('operation_duration_seconds', 'Operações externas ou caras (Mercado Pago, hash de senha).', ('operacao',))
+FAMILIAS = (requisicoes, consultas, leituras, operacoes)
+
+
+# --- Normalização das consultas ---
+# Vários textos SQL viram o mesmo rótulo: listas de parâmetros de tamanhos
+# diferentes, projeções de ?campos= e o OR de pares da venda em lote. O limite
+# vale para os rótulos; o cache de textos brutos é só um atalho e é esvaziado
+# quando enche.
+_ESPACOS = re.compile(r'\s+')
+_LISTA_VALORES = re.compile(r'\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))+')
+_LISTA_PARAMETROS = re.compile(r'\?(?:, \?)+')
+_PARES_OR = re.compile(r'\(([\w.]+) = \? AND ([\w.]+) = \?\)(?: OR \(\1 = \? AND \2 = \?\))+')
+_PROJECAO = re.compile(r'(?<=SELECT )[^,()"]+ as "\w+"(?:, [^,()"]+ as "\w+")*')
+_normalizadas = {}
+_rotulos = set()
+_lock_rotulos = threading.Lock()
+
+
+def normalizar(sql):
+    """Rótulo da consulta: texto sem espaços extras e com listas de parâmetros colapsadas."""
+    normalizada = _normalizadas.get(sql)
+    if normalizada is not None:
+        return normalizada
+    normalizada = _ESPACOS.sub(' ', sql).strip()
+    normalizada = _PROJECAO.sub('<campos>', normalizada)
+    normalizada = _PARES_OR.sub(r'(\1 = ? AND \2 = ?) OR ...', normalizada)
+    normalizada = _LISTA_VALORES.sub('(?), ...', normalizada)
+    normalizada = _LISTA_PARAMETROS.sub('?, ...', normalizada)
+    with _lock_rotulos:
+        if normalizada not in _rotulos:
+            if len(_rotulos) >= MAX_CONSULTAS:
+                normalizada = 'outras'  # rótulos não expiram: o texto pode ir para o cache
+            else:
+                _rotulos.add(normalizada)
+        if len(_normalizadas) >= MAX_CACHE_SQL:
+            _normalizadas.clear()
+        _normalizadas[sql] = normalizada
+    return normalizada
+
+
+def observar_consulta(familia, sql, segundos):
+    consulta = normalizar(sql)
+    familia.observar((consulta,), segundos)
+    if segundos * 1000 >= SLOW_QUERY_MS:
+        print(f"CONSULTA LENTA ({segundos * 1000:.1f} ms): {consulta}")
+
+
+def observar_requisicao(rota, metodo, status, segundos):
+    requisicoes.observar((rota, metodo, str(status)), segundos)
+
+
+@contextmanager
+def cronometrar(operacao):
+    """Mede um bloco de código: `with cronometrar('mercadopago_payment_get'): ...`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if METRICAS_ATIVAS:
+            operacoes.observar((operacao,), time.perf_counter() - inicio)
+
+
+def exportar():
+    linhas = []
+    for familia in FAMILIAS:
+        linhas.extend(familia.exportar())
+    return '\n'.join(linhas) + '\n'
+
+
+# --- Conexão SQLite instrumentada ---
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mede execute/executemany e as leituras fetch*."""
+
+    _sql = ''
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observar_consulta(consultas, sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            observar_consulta(consultas, sql, time.perf_counter() - inicio)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            observar_consulta(leituras, self._sql, time.perf_counter() - inicio)
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(size if size is not None else self.arraysize)
+        finally:
+            observar_consulta(leituras, self._sql, time.perf_counter() - inicio)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            observar_consulta(leituras, self._sql, time.perf_counter() - inicio)
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão (use como `factory=` do sqlite3.connect) que mede cada comando SQL e cada COMMIT."""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            observar_consulta(consultas, 'COMMIT', time.perf_counter() - inicio)
@@ -0,0 +1,76 @@
+# --- Sincronização incremental pelo log de mudanças ---
+# Os triggers da migração 013 gravam (tabela, id) em `mudancas` a cada escrita.
+# O cliente guarda o último `seq` recebido e pede só o que mudou desde então;
+# várias mudanças no mesmo registro viram uma só, com os dados atuais.
+
+TABELAS_MUDANCAS = ('produtos', 'condominios', 'estoque', 'caixa_transacoes')
+
+
+class ResincronizacaoNecessaria(Exception):
+    """O cursor do cliente é mais antigo que o histórico mantido no log."""
+
+    def __init__(self, atual):
+        super().__init__('Cursor anterior ao histórico disponível; baixe as listas completas de novo.')
+        self.atual = atual
+
+
+def cursor_atual(conn):
+    """Último seq gravado (inclusive entradas já podadas); 0 se o log nunca foi usado."""
+    linha = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'mudancas'").fetchone()
+    return linha[0] if linha else 0
+
+
+def ler_mudancas(conn, desde, limite, condominio_id=None, tabelas=TABELAS_MUDANCAS):
+    """Mudanças com seq > desde, uma por registro, em ordem de seq.
+
+    Devolve (mudancas, proximo, tem_mais): `proximo` é o cursor a usar no
+    próximo pedido. Levanta ResincronizacaoNecessaria se o log já foi podado
+    além do cursor.
+    """
+    # Tudo na mesma transação de leitura: o limite superior não se move entre as consultas
+    conn.execute('BEGIN')
+    try:
+        atual = cursor_atual(conn)
+        primeiro = conn.execute('SELECT MIN(seq) FROM mudancas').fetchone()[0]
+        if desde > atual or (desde < atual and (primeiro is None or desde < primeiro - 1)):
+            raise ResincronizacaoNecessaria(atual)
+
+        filtros = ['seq > ?', 'seq <= ?', f"tabela IN ({', '.join('?' * len(tabelas))})"]
+        params = [desde, atual, *tabelas]
+        if condominio_id:
+            filtros.append('(condominio_id IS NULL OR condominio_id = ?)')
+            params.append(condominio_id)
+        # MAX(seq) com GROUP BY: só a última mudança de cada registro
+        chaves = conn.execute(f"""
+            SELECT tabela, registro_id, MAX(seq) as seq FROM mudancas
+            WHERE {' AND '.join(filtros)}
+            GROUP BY tabela, registro_id
+            ORDER BY seq
+            LIMIT ?
+        """, (*params, limite + 1)).fetchall()
+        tem_mais = len(chaves) > limite
+        chaves = chaves[:limite]
+
+        ids_por_tabela = {}
+        for chave in chaves:
+            ids_por_tabela.setdefault(chave['tabela'], []).append(chave['registro_id'])
+        dados = {}
+        for tabela, ids in ids_por_tabela.items():
+            for linha in conn.execute(f"SELECT * FROM {tabela} WHERE id IN ({', '.join('?' * len(ids))})", ids):
+                dados[(tabela, linha['id'])] = dict(linha)
+    finally:
+        conn.execute('COMMIT')
+
+    mudancas = []
+    for chave in chaves:
+        registro = dados.get((chave['tabela'], chave['registro_id']))
+        mudancas.append({
+            'seq': chave['seq'],
+            'tabela': chave['tabela'],
+            'id': chave['registro_id'],
+            'operacao': 'upsert' if registro is not None else 'delete',
+            'dados': registro,
+        })
+    # Sem mais páginas, o cursor pula direto para o fim (inclui o que os filtros descartaram)
+    proximo = chaves[-1]['seq'] if tem_mais else max(desde, atual)
+    return mudancas, proximo, tem_mais
@@ -0,0 +1,76 @@
+import json
+import threading
+
+# --- Previsão de ruptura de estoque ---
+# A velocidade de vendas de cada item (condomínio, produto) vem de vendas_diarias,
+# em janelas de 7 e 28 dias, calculada para a frota inteira em uma única consulta
+# agrupada. O plano fica em cache até chegar uma venda nova (MAX(vendas.id)), o
+# estoque ou o catálogo mudarem (contadores de geração atualizados por triggers,
+# vistos por todos os workers) ou o dia virar.
+
+JANELA_CURTA = 7   # dias
+JANELA_LONGA = 28  # dias
+
+# A projeção usa a maior das duas velocidades: reage rápido a um pico de vendas
+# sem esquecer o histórico de um item que vendeu pouco na última semana
+CONSULTA_PLANO = f"""
+WITH velocidade AS (
+    SELECT condominio_id, produto_id,
+           SUM(CASE WHEN dia >= date('now', '-{JANELA_CURTA} days') THEN unidades ELSE 0 END) * 1.0 / {JANELA_CURTA} AS curta,
+           SUM(unidades) * 1.0 / {JANELA_LONGA} AS longa
+    FROM vendas_diarias
+    WHERE dia >= date('now', '-{JANELA_LONGA} days')
+    GROUP BY condominio_id, produto_id
+),
+projecao AS (
+    SELECT e.id, e.condominio_id, e.produto_id, e.quantidade, e.limite_critico,
+           IFNULL(v.curta, 0) AS curta, IFNULL(v.longa, 0) AS longa,
+           MAX(IFNULL(v.curta, 0), IFNULL(v.longa, 0)) AS taxa
+    FROM estoque e
+    LEFT JOIN velocidade v ON v.condominio_id = e.condominio_id AND v.produto_id = e.produto_id
+)
+SELECT c.id as condominioId, c.nome as condominioNome, c.endereco,
+       x.id as estoqueId, p.id as produtoId, p.nome as produtoNome,
+       x.quantidade, x.limite_critico,
+       ROUND(x.curta, 3) as velocidade7d, ROUND(x.longa, 3) as velocidade28d,
+       CASE WHEN x.taxa > 0 THEN ROUND(x.quantidade / x.taxa, 1) END as diasAteRuptura,
+       MAX(0, CAST(x.taxa * :cobertura AS INTEGER) + (x.taxa * :cobertura > CAST(x.taxa * :cobertura AS INTEGER))
+              + x.limite_critico - x.quantidade) as sugestaoReposicao
+FROM projecao x
+JOIN condominios c ON x.condominio_id = c.id
+JOIN produtos p ON x.produto_id = p.id
+WHERE x.quantidade <= x.limite_critico OR x.quantidade < x.taxa * :horizonte
+ORDER BY c.nome, c.endereco, diasAteRuptura IS NULL, diasAteRuptura, p.nome
+"""
+
+
+class CachePrevisao:
+    """Planos de reposição já serializados, por (horizonte, cobertura), até a próxima escrita."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = None
+        self._planos = {}
+
+    def obter(self, conn, horizonte, cobertura):
+        versao = tuple(conn.execute('''
+            SELECT (SELECT MAX(id) FROM vendas),
+                   (SELECT geracao FROM estoque_versao WHERE id = 1),
+                   (SELECT geracao FROM catalogo_versao WHERE id = 1),
+                   date('now')
+        ''').fetchone())
+        with self._lock:
+            if versao != self._versao:
+                self._versao = versao
+                self._planos = {}
+            plano = self._planos.get((horizonte, cobertura))
+        if plano is None:
+            linhas = conn.execute(CONSULTA_PLANO, {'horizonte': horizonte, 'cobertura': cobertura}).fetchall()
+            plano = json.dumps([dict(l) for l in linhas], ensure_ascii=False).encode()
+            with self._lock:
+                if versao == self._versao:
+                    self._planos[(horizonte, cobertura)] = plano
+        return plano
+
+
+cache_previsao = CachePrevisao()
@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # dependência opcional (requirements.txt): sem ela usamos o json da biblioteca padrão
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # dependência opcional (requirements.txt): sem ela só há gzip
+    brotli = None
+
+# --- Camada de respostas JSON ---
+# Serializa direto para bytes (orjson, se instalado), com ETag calculada sobre o
+# corpo; comprimir() aplica gzip/brotli nas respostas grandes, conforme o
+# Accept-Encoding do cliente.
+
+COMPRESSAO_MIN = int(os.environ.get("COMPRESSAO_MIN", "1024"))  # bytes
+COMPRESSAO_NIVEL_GZIP = 5
+COMPRESSAO_NIVEL_BROTLI = 4
+COMPRESSAO_TIPOS = ('application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain')
+MAX_COMPRIMIDAS = 64  # corpos comprimidos guardados por ETag (catálogo, previsão, ...)
+
+
+def serializar(dados):
+    """Bytes JSON de dicts, listas e linhas do sqlite3 (chaves ordenadas, como o jsonify).
+
+    Cada sqlite3.Row ainda vira um dict (nenhum codificador aceita Row direto);
+    o ganho sobre o jsonify vem do orjson e de escrever bytes sem passar por str.
+    """
+    if isinstance(dados, list) and dados and not isinstance(dados[0], dict) and hasattr(dados[0], 'keys'):
+        dados = [dict(linha) for linha in dados]
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(dados, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def resposta_json(dados, status=200):
+    """Resposta JSON com ETag; devolve 304 se o cliente já tem o mesmo conteúdo."""
+    corpo = dados if isinstance(dados, bytes) else serializar(dados)
+    resposta = Response(corpo, status=status, mimetype='application/json')
+    if status == 200:
+        resposta.set_etag(hashlib.blake2b(corpo, digest_size=16).hexdigest())
+        resposta.make_conditional(request)
+    return resposta
+
+
+class _CacheComprimidas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._corpos = {}
+
+    def obter(self, chave, comprimir):
+        with self._lock:
+            corpo = self._corpos.get(chave)
+        if corpo is None:
+            corpo = comprimir()
+            with self._lock:
+                if len(self._corpos) >= MAX_COMPRIMIDAS:
+                    self._corpos.pop(next(iter(self._corpos)))
+                self._corpos[chave] = corpo
+        return corpo
+
+
+_comprimidas = _CacheComprimidas()
+
+
+def _codificacao_aceita():
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir(resposta):
+    """Comprime o corpo (gzip ou brotli) se ele for grande e o cliente aceitar."""
+    resposta.vary.add('Accept-Encoding')
+    if (resposta.status_code != 200 or resposta.direct_passthrough or resposta.is_streamed
+            or 'Content-Encoding' in resposta.headers or resposta.mimetype not in COMPRESSAO_TIPOS):
+        return resposta
+    codificacao = _codificacao_aceita()
+    if codificacao is None:
+        return resposta
+    corpo = resposta.get_data()
+    if len(corpo) < COMPRESSAO_MIN:
+        return resposta
+
+    def comprimir_corpo():
+        if codificacao == 'br':
+            return brotli.compress(corpo, quality=COMPRESSAO_NIVEL_BROTLI)
+        return gzip.compress(corpo, compresslevel=COMPRESSAO_NIVEL_GZIP, mtime=0)
+
+    etag, _ = resposta.get_etag()
+    resposta.set_data(_comprimidas.obter((etag, codificacao), comprimir_corpo) if etag else comprimir_corpo())
+    resposta.headers['Content-Encoding'] = codificacao
+    if etag:
+        # ETag fraca: o conteúdo é o mesmo, só a codificação muda, e o
+        # If-None-Match continua valendo para a versão sem compressão
+        resposta.set_etag(etag, weak=True)
+    return resposta
@@ -0,0 +1,212 @@
+import os
+import threading
+
+import metricas
+from catalogo import cache_catalogo
+from database import abrir_conexao
+
+# --- Processamento assíncrono das notificações do Mercado Pago ---
+# A rota do webhook apenas grava o payment_id na tabela webhook_inbox e responde
+# 200 na hora. As threads deste módulo consultam o pagamento no Mercado Pago e
+# registram as vendas, uma transação por pagamento.
+
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "2"))
+WEBHOOK_MAX_TENTATIVAS = int(os.environ.get("WEBHOOK_MAX_TENTATIVAS", "5"))
+WEBHOOK_INTERVALO = float(os.environ.get("WEBHOOK_INTERVALO", "5"))  # segundos entre varreduras
+
+
+def enfileirar_notificacao(conn, payment_id):
+    """Grava a notificação na caixa de entrada.
+
+    Pagamentos já processados nunca voltam para a fila, o que evita contar a
+    mesma venda duas vezes quando o Mercado Pago reenvia a notificação.
+    """
+    conn.execute('''
+    INSERT INTO webhook_inbox (payment_id) VALUES (?)
+    ON CONFLICT (payment_id) DO UPDATE SET
+        status = 'pendente',
+        tentativas = 0,
+        proxima_tentativa = CURRENT_TIMESTAMP,
+        atualizado_em = CURRENT_TIMESTAMP
+    WHERE status IN ('ignorado', 'erro')
+    ''', (str(payment_id),))
+    conn.commit()
+
+
+class ProcessadorWebhook:
+    """Esvazia a webhook_inbox usando um cliente de pagamentos reutilizado.
+
+    `cliente_pagamentos` é qualquer objeto com o método `get(payment_id)` que
+    devolve o mesmo formato de `mercadopago.SDK(...).payment()`. Com um
+    `gravador` (gravador.GravadorEmGrupo), os itens entram nos micro-lotes dele.
+    """
+
+    def __init__(self, cliente_pagamentos, db_file=None, num_threads=WEBHOOK_WORKERS, gravador=None):
+        self.cliente_pagamentos = cliente_pagamentos
+        self.db_file = db_file
+        self.num_threads = num_threads
+        self.gravador = gravador
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def iniciar(self):
+        """Sobe as threads de processamento (uma vez por processo)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.num_threads):
+                threading.Thread(target=self._loop, name=f'webhook-{i}', daemon=True).start()
+
+    def notificar(self):
+        """Acorda as threads para processar a caixa de entrada imediatamente."""
+        self._evento.set()
+
+    def _loop(self):
+        conn = abrir_conexao(self.db_file)
+        while True:
+            try:
+                self.processar_pendentes(conn)
+            except Exception as e:
+                print(f"ERRO no processamento do webhook: {e}")
+            self._evento.wait(WEBHOOK_INTERVALO)
+            self._evento.clear()
+
+    def processar_pendentes(self, conn=None):
+        """Processa tudo o que estiver pendente e retorna quantos pagamentos foram tratados."""
+        propria = conn is None
+        conn = conn or abrir_conexao(self.db_file)
+        total = 0
+        try:
+            while self.processar_proximo(conn):
+                total += 1
+        finally:
+            if propria:
+                conn.close()
+        return total
+
+    def _reservar(self, conn):
+        # Marca um pagamento como 'processando' para que outras threads e
+        # workers não peguem o mesmo; reservas antigas (worker morto) são retomadas
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            item = conn.execute('''
+            SELECT payment_id FROM webhook_inbox
+            WHERE (status = 'pendente' AND proxima_tentativa <= CURRENT_TIMESTAMP)
+               OR (status = 'processando' AND atualizado_em < datetime('now', '-5 minutes'))
+            ORDER BY proxima_tentativa
+            LIMIT 1
+            ''').fetchone()
+            if item:
+                conn.execute(
+                    "UPDATE webhook_inbox SET status = 'processando', atualizado_em = CURRENT_TIMESTAMP WHERE payment_id = ?",
+                    (item['payment_id'],)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return item['payment_id'] if item else None
+
+    def processar_proximo(self, conn):
+        """Reserva e processa um pagamento. Retorna False quando a fila está vazia."""
+        payment_id = self._reservar(conn)
+        if payment_id is None:
+            return False
+        try:
+            self.processar_pagamento(conn, payment_id)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"ERRO ao processar o pagamento {payment_id}: {e}")
+            # Nova tentativa com espera crescente; desiste após WEBHOOK_MAX_TENTATIVAS
+            conn.execute('''
+            UPDATE webhook_inbox SET
+                tentativas = tentativas + 1,
+                status = CASE WHEN tentativas + 1 >= ? THEN 'erro' ELSE 'pendente' END,
+                proxima_tentativa = datetime('now', printf('+%d seconds', 30 * (tentativas + 1))),
+                erro = ?,
+                atualizado_em = CURRENT_TIMESTAMP
+            WHERE payment_id = ?
+            ''', (WEBHOOK_MAX_TENTATIVAS, str(e), payment_id))
+            conn.commit()
+        return True
+
+    def processar_pagamento(self, conn, payment_id):
+        """Consulta o pagamento e registra todos os itens em uma única transação."""
+        with metricas.cronometrar('mercadopago_payment_get'):
+            payment_info = self.cliente_pagamentos.get(payment_id)
+        if payment_info["status"] != 200:
+            raise RuntimeError(f"Mercado Pago respondeu com status {payment_info['status']}")
+
+        payment = payment_info["response"]
+        if payment["status"] != "approved":
+            self._finalizar(conn, payment_id, 'ignorado')
+            conn.commit()
+            return
+
+        if self.gravador is not None:
+            self.gravador.executar(self._registrar_pagamento, payment_id, payment)
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._registrar_pagamento(conn, payment_id, payment)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _registrar_pagamento(self, conn, payment_id, payment):
+        # Confere de novo dentro da transação: outro worker pode ter concluído antes
+        atual = conn.execute('SELECT status FROM webhook_inbox WHERE payment_id = ?', (payment_id,)).fetchone()
+        if atual and atual['status'] == 'processado':
+            return
+        for item in payment.get("additional_info", {}).get("items", []):
+            registrar_item(conn, item)
+        self._finalizar(conn, payment_id, 'processado')
+
+    def _finalizar(self, conn, payment_id, status):
+        conn.execute(
+            'UPDATE webhook_inbox SET status = ?, erro = NULL, atualizado_em = CURRENT_TIMESTAMP WHERE payment_id = ?',
+            (status, payment_id)
+        )
+
+
+def registrar_item(conn, item):
+    """Registra a venda de um item do pagamento (sem commit)."""
+    # Extrai o nome do produto e do condomínio
+    parts = item['title'].strip().rsplit('(', 1)
+    if len(parts) != 2:
+        print(f"ERRO: Título do produto fora do padrão: {item['title']}")
+        return
+
+    product_name = parts[0].strip()
+    condo_name = parts[1].replace(')', '').strip()
+    quantity_sold = int(item['quantity'])
+
+    # Encontra o ID do produto e do condomínio no nosso sistema (pelo cache do catálogo)
+    catalogo = cache_catalogo.obter(conn)
+    produto_db = catalogo.produto_por_nome.get(product_name)
+    condo_db = catalogo.condominio_por_nome.get(condo_name)
+
+    if not produto_db or not condo_db:
+        print(f"ERRO: Produto '{product_name}' ou Condomínio '{condo_name}' não encontrado no sistema.")
+        return
+
+    # Atualiza o estoque, só se houver quantidade suficiente (decremento atômico)
+    cursor = conn.execute(
+        'UPDATE estoque SET quantidade = quantidade - ? WHERE condominio_id = ? AND produto_id = ? AND quantidade >= ?',
+        (quantity_sold, condo_db['id'], produto_db['id'], quantity_sold)
+    )
+    if cursor.rowcount:
+        # Registra a venda
+        custo_total = produto_db['preco_custo'] * quantity_sold
+        venda_total = produto_db['preco_venda'] * quantity_sold
+        conn.execute(
+            'INSERT INTO vendas (condominio_id, produto_id, quantidade, preco_custo_total, preco_venda_total) VALUES (?, ?, ?, ?, ?)',
+            (condo_db['id'], produto_db['id'], quantity_sold, custo_total, venda_total)
+        )
+        print(f"SUCESSO: Venda de {quantity_sold}x {product_name} no {condo_name} registrada.")
+    else:
+        print(f"ERRO DE ESTOQUE: Não foi possível registrar a venda de {product_name}.")